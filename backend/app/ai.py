@@ -1,12 +1,72 @@
 from bytez import Bytez
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, Optional
+import asyncio
 import os
+import threading
+import time
 
 load_dotenv()
 key = os.getenv("BYTEZ_KEY")
 
 sdk = Bytez(key)
 
+LLM_MAX_WORKERS = int(os.getenv("LLM_MAX_WORKERS", "8"))
+# Average call latency above which the provider counts as slow
+LLM_SLOW_SECONDS = float(os.getenv("LLM_SLOW_SECONDS", "10"))
+# Weight of the latest call in the latency moving average
+LLM_LATENCY_ALPHA = 0.2
+
+# LLM calls block, so async callers run them on this pool
+_llm_executor = ThreadPoolExecutor(
+    max_workers=LLM_MAX_WORKERS,
+    thread_name_prefix="llm"
+)
+_llm_in_flight = 0
+_llm_latency: Optional[float] = None
+# Updated from the pool's threads as calls finish
+_llm_stats_lock = threading.Lock()
+
+
+def _llm_call_done(started: float, _future):
+    # Runs when the worker thread finishes, even if the caller timed out
+    # long before, so a clogged pool stays counted and its latency shows
+    global _llm_in_flight, _llm_latency
+    elapsed = time.monotonic() - started
+    with _llm_stats_lock:
+        _llm_in_flight -= 1
+        _llm_latency = elapsed if _llm_latency is None else (
+            LLM_LATENCY_ALPHA * elapsed + (1 - LLM_LATENCY_ALPHA) * _llm_latency
+        )
+
+
+async def run_llm(fn, *args, timeout: Optional[float] = None, **kwargs):
+    """
+    Run a blocking LLM helper (classification, category, ...) off the event loop
+
+    Args:
+        timeout: Seconds to wait before raising asyncio.TimeoutError. The
+            worker thread still finishes the call in the background, and
+            counts as in flight until it does.
+    """
+    global _llm_in_flight
+    with _llm_stats_lock:
+        _llm_in_flight += 1
+    future = _llm_executor.submit(partial(fn, *args, **kwargs))
+    future.add_done_callback(partial(_llm_call_done, time.monotonic()))
+    return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+
+
+def llm_under_pressure() -> bool:
+    """True while the LLM pool is saturated or the provider is slow"""
+    return _llm_in_flight >= LLM_MAX_WORKERS or (_llm_latency or 0) > LLM_SLOW_SECONDS
+
+
+def llm_load() -> Dict:
+    return {"in_flight": _llm_in_flight, "avg_latency": _llm_latency, "under_pressure": llm_under_pressure()}
+
 
 def brain(prompt: str):
     model = sdk.model("openai/gpt-4.1-mini")
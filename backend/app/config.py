@@ -10,3 +10,6 @@ JWT_SECRET = os.getenv("JWT_SECRET", "your-secret-key-change-in-production")
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
 
+
+# Gmail API Configuration
+GMAIL_MAX_WORKERS = int(os.getenv("GMAIL_MAX_WORKERS", "8"))
@@ -1,25 +1,145 @@
 from motor.motor_asyncio import AsyncIOMotorClient
-from typing import Optional
+from pymongo import monitoring
+from pymongo.read_preferences import read_pref_mode_from_name, make_read_preference
+from typing import Dict, Optional
 import os
 
 client: Optional[AsyncIOMotorClient] = None
+read_client: Optional[AsyncIOMotorClient] = None
 db = None
+read_db = None
+
+
+def _int_env(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """
+    Connection pool counters per client and server, fed by driver events
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.servers: Dict[str, Dict] = {}
+
+    def _server(self, address) -> Dict:
+        key = f"{address[0]}:{address[1]}"
+        server = self.servers.get(key)
+        if server is None:
+            server = {
+                "open": 0,
+                "in_use": 0,
+                "max_in_use": 0,
+                "checkouts": 0,
+                "checkout_failures": 0,
+                "wait_timeouts": 0,
+                "total_wait_ms": 0.0,
+                "max_wait_ms": 0.0,
+                "cleared": 0,
+            }
+            self.servers[key] = server
+        return server
+
+    def pool_created(self, event):
+        self._server(event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._server(event.address)["cleared"] += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._server(event.address)["open"] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._server(event.address)["open"] -= 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        server = self._server(event.address)
+        server["checkout_failures"] += 1
+        if event.reason == monitoring.ConnectionCheckOutFailedReason.TIMEOUT:
+            server["wait_timeouts"] += 1
+
+    def connection_checked_out(self, event):
+        server = self._server(event.address)
+        server["checkouts"] += 1
+        server["in_use"] += 1
+        server["max_in_use"] = max(server["max_in_use"], server["in_use"])
+        # duration is only reported by pymongo 4.7+
+        duration = getattr(event, "duration", None)
+        if duration is not None:
+            wait_ms = duration * 1000
+            server["total_wait_ms"] += wait_ms
+            server["max_wait_ms"] = max(server["max_wait_ms"], wait_ms)
+
+    def connection_checked_in(self, event):
+        self._server(event.address)["in_use"] -= 1
+
+
+_pool_stats = {"primary": PoolStats("primary"), "read": PoolStats("read")}
+
+
+def _client_options(prefix: str, listener: PoolStats) -> Dict:
+    """Driver options from MONGO_* (or MONGO_READ_*) environment variables"""
+    options = {
+        "maxPoolSize": _int_env(f"{prefix}_MAX_POOL_SIZE"),
+        "minPoolSize": _int_env(f"{prefix}_MIN_POOL_SIZE"),
+        "maxIdleTimeMS": _int_env(f"{prefix}_MAX_IDLE_TIME_MS"),
+        "waitQueueTimeoutMS": _int_env(f"{prefix}_WAIT_QUEUE_TIMEOUT_MS"),
+        "maxConnecting": _int_env(f"{prefix}_MAX_CONNECTING"),
+        "serverSelectionTimeoutMS": _int_env("MONGO_SERVER_SELECTION_TIMEOUT_MS"),
+        # e.g. "zstd,snappy,zlib"; zstd and snappy need their python packages
+        "compressors": os.getenv("MONGO_COMPRESSORS"),
+        "event_listeners": [listener],
+    }
+    return {k: v for k, v in options.items() if v is not None}
+
+
+def _read_preference():
+    # primary by default: a list refetched right after a write must see it.
+    # secondaryPreferred and friends are opt-in where some lag is fine
+    mode = read_pref_mode_from_name(os.getenv("MONGO_READ_PREFERENCE", "primary"))
+    max_staleness = _int_env("MONGO_READ_MAX_STALENESS_SECONDS") or -1
+    return make_read_preference(mode, tag_sets=None, max_staleness=max_staleness)
+
 
 async def connect_db():
-    global client, db
+    global client, read_client, db, read_db
     try:
         print("🔌 Connecting to MongoDB Atlas...")
-        
+
         # Get MongoDB URI from environment variable
         MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
         DATABASE_NAME = os.getenv("DATABASE_NAME", "hackathon")
-        
-        client = AsyncIOMotorClient(MONGODB_URI)
+
+        client = AsyncIOMotorClient(MONGODB_URI, **_client_options("MONGO", _pool_stats["primary"]))
         db = client[DATABASE_NAME]
-        
+
+        # Heavy list reads can go to secondaries (MONGO_READ_PREFERENCE),
+        # optionally over their own client (e.g. an analytics node) so they
+        # cannot starve the main pool
+        MONGODB_READ_URI = os.getenv("MONGODB_READ_URI")
+        if MONGODB_READ_URI:
+            read_client = AsyncIOMotorClient(MONGODB_READ_URI, **_client_options("MONGO_READ", _pool_stats["read"]))
+            read_db = read_client.get_database(DATABASE_NAME, read_preference=_read_preference())
+        else:
+            read_db = client.get_database(DATABASE_NAME, read_preference=_read_preference())
+
         # Test the connection
         await client.admin.command('ping')
-        
+
         print(f"🚀 Connected to MongoDB Atlas: {DATABASE_NAME}")
         return db
     except Exception as e:
@@ -27,14 +147,34 @@ async def connect_db():
         raise
 
 async def close_db():
-    global client
+    global read_client
     if client:
         print("👋 Closing MongoDB connection...")
         client.close()
         print(" MongoDB connection closed")
+    if read_client:
+        read_client.close()
+        read_client = None
 
 def get_database():
     """Get the database instance"""
     if db is None:
         raise RuntimeError("Database not initialized. Call connect_db() first.")
-    return db
\ No newline at end of file
+    return db
+
+def get_read_database():
+    """
+    Get the database instance for list and dashboard reads. These go to
+    the primary unless MONGO_READ_PREFERENCE allows secondaries, in which
+    case they may lag slightly behind writes
+    """
+    if read_db is None:
+        raise RuntimeError("Database not initialized. Call connect_db() first.")
+    return read_db
+
+def pool_stats() -> Dict:
+    """Connection pool counters of the primary and read clients"""
+    stats = {"primary": _pool_stats["primary"].servers}
+    if read_client:
+        stats["read"] = _pool_stats["read"].servers
+    return stats
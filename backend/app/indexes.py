@@ -0,0 +1,153 @@
+"""
+Declarative registry of the MongoDB indexes every collection needs.
+
+Applied at startup and safe to re-run: indexes that already exist with the
+same keys and options are left alone. Also runnable on its own:
+
+    python -m app.indexes          # create missing indexes
+    python -m app.indexes --stats  # report how often each index is used
+"""
+import argparse
+import asyncio
+from typing import Dict, List
+
+from dotenv import load_dotenv
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from app.database import connect_db, close_db, get_database
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True),
+        # Every Gmail call resolves the bearer token to a user
+        IndexModel([("access_token", ASCENDING)]),
+        IndexModel([("google_id", ASCENDING)], sparse=True),
+        IndexModel([("company_id", ASCENDING), ("role", ASCENDING)]),
+    ],
+    "companies": [
+        IndexModel([("email", ASCENDING)]),
+        IndexModel([("is_active", ASCENDING), ("_id", ASCENDING)]),
+    ],
+    "issues": [
+        # Newest first listing, optionally narrowed by status or priority
+        IndexModel([("company_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("company_id", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("company_id", ASCENDING), ("priority", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("assigned_to", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]),
+        # Follow-up emails find the issue opened for their Gmail thread
+        IndexModel([("company_id", ASCENDING), ("thread_id", ASCENDING)]),
+        # Rollup refreshes find days with recently changed issues
+        IndexModel([("updated_at", DESCENDING)]),
+    ],
+    "emails": [
+        IndexModel([("company_id", ASCENDING), ("processed_at", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("company_id", ASCENDING), ("status", ASCENDING), ("processed_at", DESCENDING), ("_id", DESCENDING)]),
+        IndexModel([("company_id", ASCENDING), ("email_id", ASCENDING)]),
+    ],
+    "outbox": [
+        IndexModel(
+            [("kind", ASCENDING), ("issue_id", ASCENDING), ("email_id", ASCENDING), ("recipient", ASCENDING)],
+            unique=True,
+            name="outbox_dedupe"
+        ),
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)]),
+    ],
+    "processing_ledger": [
+        IndexModel([("company_id", ASCENDING), ("email_id", ASCENDING)], unique=True),
+    ],
+    "mailboxes": [
+        IndexModel([("company_id", ASCENDING)], unique=True),
+        IndexModel([("enabled", ASCENDING), ("next_poll_at", ASCENDING)]),
+    ],
+    "daily_stats": [
+        # Also the key $merge matches rollups on
+        IndexModel([("company_id", ASCENDING), ("day", ASCENDING)], unique=True),
+    ],
+    "rollup_dirty": [
+        IndexModel([("company_id", ASCENDING), ("day", ASCENDING)], unique=True),
+    ],
+    "deferred_work": [
+        IndexModel([("kind", ASCENDING), ("company_id", ASCENDING), ("email_id", ASCENDING)], unique=True),
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)]),
+    ],
+}
+
+
+async def ensure_indexes() -> Dict[str, List[str]]:
+    """
+    Create every index in INDEXES that does not exist yet. An index that
+    cannot be built (e.g. duplicate emails blocking the unique index) is
+    reported and skipped rather than stopping startup.
+
+    Returns:
+        Collection name -> names of the registry indexes now in place
+    """
+    db = get_database()
+    applied: Dict[str, List[str]] = {}
+
+    for collection, indexes in INDEXES.items():
+        applied[collection] = []
+        # One at a time, so one index that cannot be built does not hold back the rest
+        for model in indexes:
+            try:
+                applied[collection].extend(await db[collection].create_indexes([model]))
+            except OperationFailure as e:
+                print(f" Failed to create index {model.document['name']} on {collection}: {e}")
+
+    print(f"📇 Ensured {sum(len(names) for names in applied.values())} indexes")
+    return applied
+
+
+async def index_usage() -> List[Dict]:
+    """
+    Usage of every index on the registry's collections, from $indexStats
+
+    Returns:
+        One dict per index with collection, name, ops since the server last
+        restarted, whether the registry declares it, and whether it exists
+    """
+    db = get_database()
+    report = []
+
+    for collection, indexes in INDEXES.items():
+        declared = {model.document["name"] for model in indexes}
+        seen = set()
+
+        async for stat in db[collection].aggregate([{"$indexStats": {}}]):
+            seen.add(stat["name"])
+            report.append({
+                "collection": collection,
+                "name": stat["name"],
+                "ops": stat["accesses"]["ops"],
+                "since": stat["accesses"]["since"],
+                "declared": stat["name"] in declared or stat["name"] == "_id_",
+                "exists": True,
+            })
+
+        for name in sorted(declared - seen):
+            report.append({"collection": collection, "name": name, "ops": 0, "since": None, "declared": True, "exists": False})
+
+    return report
+
+
+async def _main(show_stats: bool):
+    await connect_db()
+    try:
+        await ensure_indexes()
+        if show_stats:
+            for row in await index_usage():
+                flag = "" if row["exists"] else "  (missing)"
+                if row["exists"] and not row["declared"]:
+                    flag = "  (not in registry)"
+                print(f"{row['collection']:<20} {row['name']:<70} {row['ops']:>10}{flag}")
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Create the registry's MongoDB indexes")
+    parser.add_argument("--stats", action="store_true", help="Report index usage after applying")
+    args = parser.parse_args()
+    asyncio.run(_main(args.stats))
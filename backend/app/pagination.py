@@ -0,0 +1,215 @@
+"""
+Keyset (cursor) pagination for list endpoints.
+
+Pages are ordered by (sort key, _id), and a cursor records where the last page
+ended, so deep pages cost the same as the first one and rows inserted while a
+client pages through do not shift the results.
+"""
+import asyncio
+import base64
+import os
+import time
+from enum import Enum
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import json_util
+from fastapi import HTTPException
+from pymongo import DESCENDING
+
+# How long a cached total stays valid for count=cached
+COUNT_CACHE_TTL = float(os.getenv("COUNT_CACHE_TTL", "30"))
+COUNT_CACHE_SIZE = 1000
+
+# (collection, filter) -> (total, expires at)
+_count_cache: Dict[Tuple[str, str], Tuple[int, float]] = {}
+
+
+class ListView(str, Enum):
+    SUMMARY = "summary"
+    FULL = "full"
+
+
+class CountMode(str, Enum):
+    # Counted alongside every page
+    EXACT = "exact"
+    # Exact, but reused for COUNT_CACHE_TTL seconds
+    CACHED = "cached"
+    # Collection size from metadata when unfiltered, else like cached
+    ESTIMATE = "estimate"
+    # No total at all
+    NONE = "none"
+
+
+def encode_cursor(sort_field: str, doc: Dict) -> str:
+    """Opaque cursor pointing just past doc"""
+    payload = json_util.dumps({"k": sort_field, "v": doc.get(sort_field), "id": doc["_id"]})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_field: str) -> Tuple[Any, Any]:
+    """
+    Returns:
+        (sort value, _id) of the last row of the previous page
+    """
+    try:
+        payload = json_util.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if payload["k"] != sort_field:
+            raise ValueError("cursor belongs to a different ordering")
+        return payload["v"], payload["id"]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def sort_spec(sort_field: str, direction: int = DESCENDING) -> List[Tuple[str, int]]:
+    if sort_field == "_id":
+        return [("_id", direction)]
+    return [(sort_field, direction), ("_id", direction)]
+
+
+def build_projection(view: ListView, fields: Optional[str], summary_fields: List[str]) -> Optional[Dict]:
+    """
+    Mongo projection for a list request. fields (comma separated) wins over
+    view; view=full returns whole documents.
+    """
+    if fields:
+        names = [f.strip() for f in fields.split(",") if f.strip()]
+        if any(name.startswith("$") for name in names):
+            raise HTTPException(status_code=400, detail="Invalid field name")
+    elif view == ListView.SUMMARY:
+        names = summary_fields
+    else:
+        return None
+    return {name: 1 for name in names}
+
+
+def _with_sort_field(projection: Optional[Dict], sort_field: str) -> Optional[Dict]:
+    # The cursor is built from the sort key, so it must survive the projection
+    if projection is None or sort_field in projection:
+        return projection
+    return {**projection, sort_field: 1}
+
+
+def _cursor_condition(sort_field: str, cursor: str, direction: int) -> Dict:
+    value, last_id = decode_cursor(cursor, sort_field)
+    after = "$lt" if direction == DESCENDING else "$gt"
+
+    if sort_field == "_id":
+        condition = {"_id": {after: last_id}}
+    elif value is None:
+        # Missing sort keys order below every value, so only other rows
+        # without one can follow
+        if direction == DESCENDING:
+            condition = {sort_field: None, "_id": {after: last_id}}
+        else:
+            condition = {"$or": [{sort_field: {"$ne": None}}, {sort_field: None, "_id": {after: last_id}}]}
+    else:
+        branches = [{sort_field: {after: value}}, {sort_field: value, "_id": {after: last_id}}]
+        if direction == DESCENDING:
+            branches.append({sort_field: None})
+        condition = {"$or": branches}
+    return condition
+
+
+def cursor_filter(query_filter: Dict, sort_field: str, cursor: Optional[str], direction: int = DESCENDING) -> Dict:
+    """
+    Narrow query_filter to the rows after cursor in (sort_field, _id) order
+    """
+    if not cursor:
+        return query_filter
+    condition = _cursor_condition(sort_field, cursor, direction)
+    return {"$and": [query_filter, condition]} if query_filter else condition
+
+
+async def find_page(
+    collection,
+    query_filter: Dict,
+    sort_field: str,
+    limit: int,
+    skip: int = 0,
+    cursor: Optional[str] = None,
+    direction: int = DESCENDING,
+    projection: Optional[Dict] = None,
+) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Fetch one page in (sort_field, _id) order. skip is kept for older
+    clients and ignored when a cursor is given.
+
+    Returns:
+        (documents, cursor for the next page or None on the last page)
+    """
+    query = collection.find(
+        cursor_filter(query_filter, sort_field, cursor, direction),
+        _with_sort_field(projection, sort_field)
+    )
+    query = query.sort(sort_spec(sort_field, direction))
+    if skip and not cursor:
+        query = query.skip(skip)
+
+    docs = await query.limit(limit + 1).to_list(length=limit + 1)
+    return _split_page(docs, sort_field, limit)
+
+
+def _split_page(docs: List[Dict], sort_field: str, limit: int) -> Tuple[List[Dict], Optional[str]]:
+    next_cursor = encode_cursor(sort_field, docs[limit - 1]) if len(docs) > limit else None
+    return docs[:limit], next_cursor
+
+
+def _count_key(collection, query_filter: Dict) -> Tuple[str, str]:
+    return collection.name, json_util.dumps(query_filter, sort_keys=True)
+
+
+def _cached_count(key: Tuple[str, str]) -> Optional[int]:
+    cached = _count_cache.get(key)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+    return None
+
+
+def _store_count(key: Tuple[str, str], total: int):
+    if len(_count_cache) >= COUNT_CACHE_SIZE:
+        now = time.monotonic()
+        for stale in [k for k, (_, expires) in _count_cache.items() if expires <= now]:
+            del _count_cache[stale]
+        if len(_count_cache) >= COUNT_CACHE_SIZE:
+            _count_cache.clear()
+    _count_cache[key] = (total, time.monotonic() + COUNT_CACHE_TTL)
+
+
+async def fetch_page(
+    collection,
+    query_filter: Dict,
+    sort_field: str,
+    limit: int,
+    skip: int = 0,
+    cursor: Optional[str] = None,
+    direction: int = DESCENDING,
+    count: CountMode = CountMode.EXACT,
+    projection: Optional[Dict] = None,
+) -> Tuple[List[Dict], Optional[str], Optional[int]]:
+    """
+    Fetch one page like find_page, together with the total number of rows
+    matching query_filter. Exact totals come from a count_documents run
+    concurrently with the page query, so the page still uses the cursor,
+    limit and projection and the count can be answered from an index.
+
+    Returns:
+        (documents, cursor for the next page, total or None for count=none)
+    """
+    key = _count_key(collection, query_filter)
+    total: Optional[int] = None
+
+    if count == CountMode.ESTIMATE and not query_filter:
+        total = await collection.estimated_document_count()
+    elif count in (CountMode.CACHED, CountMode.ESTIMATE):
+        total = _cached_count(key)
+
+    if total is not None or count == CountMode.NONE:
+        docs, next_cursor = await find_page(collection, query_filter, sort_field, limit, skip, cursor, direction, projection)
+        return docs, next_cursor, total
+
+    (docs, next_cursor), total = await asyncio.gather(
+        find_page(collection, query_filter, sort_field, limit, skip, cursor, direction, projection),
+        collection.count_documents(query_filter)
+    )
+    _store_count(key, total)
+    return docs, next_cursor, total
@@ -1,8 +1,10 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Response
 from bson import ObjectId
-from datetime import datetime
+from pymongo import ASCENDING
+from datetime import datetime, timedelta
 from typing import Optional, List
-from app.database import get_database
+from app.database import get_database, get_read_database
+from app.pagination import find_page
 from app.schemas.company import (
     CompanyCreate, 
     CompanyUpdate, 
@@ -10,6 +12,8 @@ from app.schemas.company import (
     CompanyWithEmployees
 )
 from app.schemas.user import UserRole
+from app.services.employees import get_roster
+from app.services.rollups import DAY_FORMAT, company_stats
 
 router = APIRouter()
 
@@ -100,15 +104,18 @@ async def create_company(company_data: CompanyCreate):
 
 @router.get("/", response_model=List[CompanyOut])
 async def get_all_companies(
-    skip: int = Query(0, ge=0, description="Number of records to skip"),
+    response: Response,
+    skip: int = Query(0, ge=0, description="Number of records to skip, ignored when cursor is set"),
     limit: int = Query(100, ge=1, le=200, description="Number of records to return"),
-    active_only: bool = Query(True, description="Return only active companies")
+    active_only: bool = Query(True, description="Return only active companies"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor header of the previous page"),
 ):
     """
-    Get all companies with pagination
+    Get all companies with pagination, oldest first.
+    The cursor for the next page is returned in the X-Next-Cursor header.
     """
     try:
-        db = get_database()
+        db = get_read_database()
         
         # Build query filter
         query_filter = {}
@@ -116,7 +123,11 @@ async def get_all_companies(
             query_filter["is_active"] = True
         
         # Get companies with pagination
-        companies = await db.companies.find(query_filter).skip(skip).limit(limit).to_list(length=limit)
+        companies, next_cursor = await find_page(
+            db.companies, query_filter, "_id", limit, skip=skip, cursor=cursor, direction=ASCENDING
+        )
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
         
         # Convert to response model
         result = []
@@ -126,6 +137,8 @@ async def get_all_companies(
         
         return result
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error fetching companies: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to fetch companies")
@@ -183,20 +196,19 @@ async def get_company_with_employees(company_id: str):
         if not company:
             raise HTTPException(status_code=404, detail="Company not found")
         
-        # Get employees for this company
-        employees = await db.users.find({"company_id": company_id, "role": UserRole.EMPLOYEE.value}).to_list(100)
-        
-        # Prepare employee data (exclude sensitive info)
-        employee_list = []
-        for emp in employees:
-            employee_list.append({
-                "id": str(emp["_id"]),
-                "name": emp.get("name"),
-                "email": emp.get("email"),
-                "department": emp.get("department"),
-                "position": emp.get("position"),
-                "is_onboarded": emp.get("is_onboarded", False)
-            })
+        # Get employees for this company (exclude sensitive info)
+        employees = await get_roster(company_id)
+        employee_list = [
+            {
+                "id": emp["id"],
+                "name": emp["name"],
+                "email": emp["email"],
+                "department": emp["department"],
+                "position": emp["position"],
+                "is_onboarded": emp["is_onboarded"]
+            }
+            for emp in employees
+        ]
         
         # Prepare response
         company_data = company.copy()
@@ -212,6 +224,34 @@ async def get_company_with_employees(company_id: str):
         print(f"Error fetching company with employees: {str(e)}")
         raise HTTPException(status_code=400, detail="Invalid company ID")
 
+@router.get("/{company_id}/stats")
+async def get_company_stats(
+    company_id: str,
+    days: int = Query(30, ge=1, le=366, description="Number of days to report, ending today (UTC)")
+):
+    """
+    Issue and email counts for a company, per day and in total, by status,
+    category, priority, assignee and classification. Served from the daily
+    rollups, which are refreshed every few minutes.
+    """
+    try:
+        db = get_read_database()
+        
+        end = datetime.utcnow()
+        start = end - timedelta(days=days - 1)
+        stats = await company_stats(company_id, start.strftime(DAY_FORMAT), end.strftime(DAY_FORMAT), db)
+        
+        return {
+            "company_id": company_id,
+            "from": start.strftime(DAY_FORMAT),
+            "to": end.strftime(DAY_FORMAT),
+            **stats
+        }
+        
+    except Exception as e:
+        print(f"Error fetching company stats: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to fetch company stats")
+
 @router.put("/{company_id}", response_model=CompanyOut)
 async def update_company(company_id: str, company_data: CompanyUpdate):
     """
@@ -1,11 +1,22 @@
 from fastapi import APIRouter, HTTPException, Query
 from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional
 import traceback
-from app.database import get_database
-from app.schemas.issues import IssueCreate, IssueStatus, IssuePriority, IssueSource, IssueUpdate
-from app.schemas.company import UserRole
+from app.database import get_database, get_read_database
+from app.pagination import CountMode, ListView, build_projection, fetch_page
+from app.schemas.issues import (
+    IssueCreate, IssueUpdate, ISSUE_SUMMARY_FIELDS,
+    IssueBulkUpdate, BulkItemStatus
+)
+from app.services.employees import get_assignee, get_assignees
+from app.services.rollups import mark_day_dirty
+from app.services.workload import add_load_change, apply_load_changes
+
+# Items accepted by PATCH /issues/bulk in one request
+BULK_UPDATE_LIMIT = 500
 
 router = APIRouter()
 
@@ -31,6 +42,10 @@ async def create_issue(issue_data: IssueCreate):
         result = await db.issues.insert_one(issue_dict)
         issue_id = str(result.inserted_id)
         
+        load = {}
+        add_load_change(load, None, issue_dict)
+        await apply_load_changes(load)
+        
         print(f" Issue created successfully: {issue_id}")
         return {
             "id": issue_id,
@@ -49,12 +64,16 @@ async def get_all_issues(
     status: Optional[str] = Query(None, description="Filter by status"),
     priority: Optional[str] = Query(None, description="Filter by priority"),
     assigned_to: Optional[str] = Query(None, description="Filter by assigned employee ID"),
-    skip: int = Query(0, ge=0, description="Number of records to skip"),
+    skip: int = Query(0, ge=0, description="Number of records to skip, ignored when cursor is set"),
     limit: int = Query(50, ge=1, le=200, description="Number of records to return"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    count: CountMode = Query(CountMode.EXACT, description="How to compute total: exact, cached, estimate or none"),
+    view: ListView = Query(ListView.FULL, description="summary returns only the fields a board needs"),
+    fields: Optional[str] = Query(None, description="Comma separated fields to return, overrides view"),
 ):
     
     try:
-        db = get_database()
+        db = get_read_database()
         
         # Build query filter
         query_filter = {}
@@ -68,47 +87,17 @@ async def get_all_issues(
         if assigned_to:
             query_filter["assigned_to"] = assigned_to
         
-        # Get total count
-        total_count = await db.issues.count_documents(query_filter)
-        
-        # Get issues with pagination
-        issues = await db.issues.find(query_filter).skip(skip).limit(limit).to_list(length=limit)
+        # Get one page of issues, newest first, and the total count
+        issues, next_cursor, total_count = await fetch_page(
+            db.issues, query_filter, "created_at", limit, skip=skip, cursor=cursor, count=count,
+            projection=build_projection(view, fields, ISSUE_SUMMARY_FIELDS)
+        )
         
-        # Collect all unique assigned_to IDs
-        assigned_user_ids = set()
-        for issue in issues:
-            if issue.get("assigned_to"):
-                assigned_user_ids.add(issue["assigned_to"])
-        
-        # Fetch all assigned users in one query
-        assigned_users = {}
-        if assigned_user_ids:
-            # Convert string IDs to ObjectId for querying
-            object_ids = []
-            for uid in assigned_user_ids:
-                try:
-                    object_ids.append(ObjectId(uid))
-                except:
-                    # Skip invalid ObjectId formats
-                    continue
-            
-            if object_ids:
-                users = await db.users.find({
-                    "_id": {"$in": object_ids}
-                }).to_list(1000)
-                
-                # Create mapping using string IDs as keys (matching issue format)
-                for user in users:
-                    user_id = str(user["_id"])
-                    assigned_users[user_id] = {
-                        "id": user_id,
-                        "name": user.get("name"),
-                        "email": user.get("email"),
-                        "department": user.get("department"),
-                        "position": user.get("position"),
-                        "skills": user.get("skills", []),
-                        "tags": user.get("tags", []),
-                    }
+        # Assigned users, mostly from the company's cached roster
+        assigned_users = await get_assignees(
+            [issue["assigned_to"] for issue in issues if issue.get("assigned_to")],
+            company_id
+        )
         
         # Convert ObjectId to string and create JSON-serializable dicts
         result = []
@@ -133,9 +122,12 @@ async def get_all_issues(
             "total": total_count,
             "skip": skip,
             "limit": limit,
-            "count": len(result)
+            "count": len(result),
+            "next_cursor": next_cursor
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error fetching issues: {str(e)}")
         traceback.print_exc()
@@ -148,14 +140,16 @@ async def get_employee_assigned_issues(
     status: Optional[str] = Query(None, description="Filter by status"),
     priority: Optional[str] = Query(None, description="Filter by priority"),
     company_id: Optional[str] = Query(None, description="Filter by company ID"),
-    skip: int = Query(0, ge=0, description="Number of records to skip"),
+    skip: int = Query(0, ge=0, description="Number of records to skip, ignored when cursor is set"),
     limit: int = Query(50, ge=1, le=200, description="Number of records to return"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    count: CountMode = Query(CountMode.EXACT, description="How to compute total: exact, cached, estimate or none"),
 ):
     """
     Get all issues assigned to a specific employee
     """
     try:
-        db = get_database()
+        db = get_read_database()
         
         # Verify employee exists
         try:
@@ -175,11 +169,10 @@ async def get_employee_assigned_issues(
         if priority:
             query_filter["priority"] = priority
         
-        # Get total count
-        total_count = await db.issues.count_documents(query_filter)
-        
-        # Get issues with pagination
-        issues = await db.issues.find(query_filter).skip(skip).limit(limit).to_list(length=limit)
+        # Get one page of issues, newest first, and the total count
+        issues, next_cursor, total_count = await fetch_page(
+            db.issues, query_filter, "created_at", limit, skip=skip, cursor=cursor, count=count
+        )
         
         # Get employee information for assigned_user
         employee_info = {
@@ -211,6 +204,7 @@ async def get_employee_assigned_issues(
             "skip": skip,
             "limit": limit,
             "count": len(result),
+            "next_cursor": next_cursor,
             "employee": employee_info
         }
         
@@ -222,6 +216,110 @@ async def get_employee_assigned_issues(
         raise HTTPException(status_code=500, detail=f"Failed to fetch assigned issues: {str(e)}")
 
 
+@router.patch("/bulk")
+async def bulk_update_issues(bulk_data: IssueBulkUpdate):
+    """
+    Apply changes to many issues in one bulk write, e.g. a kanban drag of
+    several cards or a bulk reassignment. Items succeed or fail on their
+    own; each gets a status in results, in request order.
+    """
+    if len(bulk_data.items) > BULK_UPDATE_LIMIT:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_UPDATE_LIMIT} items per request")
+    
+    try:
+        db = get_database()
+        now = datetime.utcnow()
+        
+        results = [{"id": item.id, "status": BulkItemStatus.INVALID.value} for item in bulk_data.items]
+        object_ids = {}
+        for index, item in enumerate(bulk_data.items):
+            try:
+                oid = ObjectId(item.id)
+            except Exception:
+                results[index]["detail"] = "Invalid issue ID"
+                continue
+            if oid in object_ids:
+                results[index]["detail"] = "Duplicate issue ID"
+                continue
+            object_ids[oid] = index
+        
+        # Current assignee and status of every issue, for the workload counters
+        current = {
+            issue["_id"]: issue
+            async for issue in db.issues.find(
+                {"_id": {"$in": list(object_ids)}},
+                {"assigned_to": 1, "status": 1, "company_id": 1}
+            )
+        }
+        
+        operations = []
+        planned = []
+        for oid, index in object_ids.items():
+            issue = current.get(oid)
+            if not issue:
+                results[index]["status"] = BulkItemStatus.NOT_FOUND.value
+                continue
+            
+            update_dict = bulk_data.items[index].changes.model_dump(exclude_unset=True, exclude_none=True)
+            update_dict["updated_at"] = now
+            
+            # Only apply if assignee and status are still what the counters
+            # were computed from
+            operations.append(UpdateOne(
+                {"_id": oid, "assigned_to": issue.get("assigned_to"), "status": issue.get("status")},
+                {"$set": update_dict}
+            ))
+            planned.append((oid, index, issue, {**issue, **update_dict}))
+        
+        failed = {}
+        matched = 0
+        if operations:
+            try:
+                result = await db.issues.bulk_write(operations, ordered=False)
+                matched = result.matched_count
+            except BulkWriteError as e:
+                matched = e.details.get("nMatched", 0)
+                for error in e.details.get("writeErrors", []):
+                    failed[error["index"]] = error.get("errmsg", "Write failed")
+        
+        applied = {oid for oid, _, _, _ in planned}
+        if matched < len(operations) - len(failed):
+            # Some filters missed: find which updates actually landed
+            applied = {
+                issue["_id"]
+                async for issue in db.issues.find(
+                    {"_id": {"$in": [oid for oid, _, _, _ in planned]}, "updated_at": now},
+                    {"_id": 1}
+                )
+            }
+        
+        load = {}
+        for position, (oid, index, before, after) in enumerate(planned):
+            if position in failed:
+                results[index].update(status=BulkItemStatus.FAILED.value, detail=failed[position])
+            elif oid in applied:
+                results[index]["status"] = BulkItemStatus.UPDATED.value
+                add_load_change(load, before, after)
+            else:
+                results[index].update(status=BulkItemStatus.CONFLICT.value, detail="Issue changed during the update, retry")
+        await apply_load_changes(load)
+        
+        updated = sum(1 for r in results if r["status"] == BulkItemStatus.UPDATED.value)
+        print(f" Bulk updated {updated}/{len(results)} issues")
+        return {
+            "results": results,
+            "updated": updated,
+            "failed": len(results) - updated
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f" Error bulk updating issues: {str(e)}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Failed to update issues: {str(e)}")
+
+
 @router.get("/{issue_id}")
 async def get_issue(issue_id: str):
  
@@ -248,24 +346,23 @@ async def update_issue(issue_id: str, update_data: IssueUpdate):
     try:
         db = get_database()
         
-        # Check if issue exists
-        issue = await db.issues.find_one({"_id": ObjectId(issue_id)})
-        if not issue:
-            raise HTTPException(status_code=404, detail="Issue not found")
-        
         update_dict = update_data.model_dump(exclude_unset=True, exclude_none=True)
-        
-        if "assigned_to" not in update_dict:
-            update_dict["assigned_to"] = issue.get("assigned_to")
-        
         update_dict["updated_at"] = datetime.utcnow()
         
-        result = await db.issues.update_one(
+        # Update in one round trip. The workload counters need the issue as it
+        # was, and with only $set the result is that plus update_dict
+        previous_issue = await db.issues.find_one_and_update(
             {"_id": ObjectId(issue_id)},
-            {"$set": update_dict}
+            {"$set": update_dict},
+            return_document=ReturnDocument.BEFORE
         )
+        if not previous_issue:
+            raise HTTPException(status_code=404, detail="Issue not found")
+        updated_issue = {**previous_issue, **update_dict}
         
-        updated_issue = await db.issues.find_one({"_id": ObjectId(issue_id)})
+        load = {}
+        add_load_change(load, previous_issue, updated_issue)
+        await apply_load_changes(load)
         
         issue_dict = dict(updated_issue)
         issue_dict["id"] = str(issue_dict["_id"])
@@ -273,20 +370,9 @@ async def update_issue(issue_id: str, update_data: IssueUpdate):
         
         assigned_to_id = issue_dict.get("assigned_to")
         if assigned_to_id:
-            try:
-                user = await db.users.find_one({"_id": ObjectId(assigned_to_id)})
-                if user:
-                    issue_dict["assigned_user"] = {
-                        "id": str(user["_id"]),
-                        "name": user.get("name"),
-                        "email": user.get("email"),
-                        "department": user.get("department"),
-                        "position": user.get("position"),
-                        "skills": user.get("skills", []),
-                        "tags": user.get("tags", []),
-                    }
-            except:
-                pass
+            assigned_user = await get_assignee(assigned_to_id)
+            if assigned_user:
+                issue_dict["assigned_user"] = assigned_user
         
         print(f" Issue updated successfully: {issue_id}")
         return issue_dict
@@ -313,7 +399,13 @@ async def delete_issue(issue_id: str):
             raise HTTPException(status_code=404, detail="Issue not found")
         
         # Delete issue
-        await db.issues.delete_one({"_id": ObjectId(issue_id)})
+        result = await db.issues.delete_one({"_id": ObjectId(issue_id)})
+        if result.deleted_count:
+            load = {}
+            add_load_change(load, issue, None)
+            await apply_load_changes(load)
+            # Deletes leave no updated_at for the rollups to find
+            await mark_day_dirty(issue.get("company_id"), issue.get("created_at"))
         
         print(f" Issue deleted: {issue_id}")
         return {"message": "Issue deleted successfully", "issue_id": issue_id}
@@ -1,7 +1,9 @@
 from fastapi import APIRouter, HTTPException
 from bson import ObjectId
-from datetime import datetime
+from datetime import datetime, timedelta
 from app.database import get_database
+from app.services.employees import invalidate_employee, invalidate_roster
+from app.services.gmail import GOOGLE_TOKEN_LIFETIME_SECONDS, invalidate_user_credentials
 from app.schemas.user import (
     UserCreate, UserOut, TokenSave, 
     UserRole
@@ -20,6 +22,11 @@ async def save_token(data: TokenSave):
         print(f"Received token save request for: {data.user.email}")
         
         existing_user = await db.users.find_one({"email": data.user.email})
+        if data.expires_at:
+            token_expiry = datetime.utcfromtimestamp(data.expires_at)
+        else:
+            # Older clients do not send it; Google access tokens last an hour
+            token_expiry = datetime.utcnow() + timedelta(seconds=GOOGLE_TOKEN_LIFETIME_SECONDS)
         
         if existing_user:
             print(f"Updating existing user: {data.user.email}")
@@ -29,6 +36,7 @@ async def save_token(data: TokenSave):
                     "$set": {
                         "access_token": data.access_token,
                         "refresh_token": data.refresh_token,
+                        "token_expiry": token_expiry,
                         "name": data.user.name,
                         "google_id": data.user.id,
                         "image": data.user.image,
@@ -38,6 +46,8 @@ async def save_token(data: TokenSave):
                 }
             )
             user_id = str(existing_user["_id"])
+            invalidate_user_credentials(user_id)
+            invalidate_employee(user_id, existing_user.get("company_id"))
         else:
             print(f" Creating new user: {data.user.email}")
             user_doc = {
@@ -47,6 +57,7 @@ async def save_token(data: TokenSave):
                 "image": data.user.image,
                 "access_token": data.access_token,
                 "refresh_token": data.refresh_token,
+                "token_expiry": token_expiry,
                 "role": UserRole.USER.value,
                 "created_at": datetime.utcnow(),
                 "updated_at": datetime.utcnow(),
@@ -83,6 +94,7 @@ async def create_user(data: UserCreate):
     user["updated_at"] = datetime.utcnow()
     user["is_onboarded"] = False
     result = await db.users.insert_one(user)
+    invalidate_roster()
     
     return UserOut(
         id=str(result.inserted_id),
@@ -109,6 +121,7 @@ async def create_employee(data: EmployeeCreate):
     
     # Insert into database
     result = await db.users.insert_one(employee_data)
+    invalidate_roster(employee_data.get("company_id"))
     
     return EmployeeOut(
         id=str(result.inserted_id),
@@ -218,6 +231,7 @@ async def update_user_role(user_id: str, role: UserRole):
         )
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="User not found")
+        invalidate_employee(user_id)
         
         return {"message": "User role updated successfully"}
     except Exception as e:
@@ -230,6 +244,8 @@ async def delete_user(user_id: str):
         result = await db.users.delete_one({"_id": ObjectId(user_id)})
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="User not found")
+        invalidate_user_credentials(user_id)
+        invalidate_employee(user_id)
         
         return {"message": "User deleted successfully"}
     except Exception as e:
@@ -1,5 +1,11 @@
 from pydantic import BaseModel
 
+# Fields returned by list endpoints with view=summary
+EMAIL_SUMMARY_FIELDS = [
+    "email_id", "company_id", "sender", "subject", "classification", "category",
+    "status", "assigned_to", "issue_id", "thread_id", "processed_at"
+]
+
 class EmailCreate(BaseModel):
     sender: str
     subject: str
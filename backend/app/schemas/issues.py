@@ -26,6 +26,13 @@ class IssuePriority(str, Enum):
     HIGH = "high"
 
 
+# Fields returned by list endpoints with view=summary (kanban cards)
+ISSUE_SUMMARY_FIELDS = [
+    "company_id", "subject", "status", "priority", "category",
+    "assigned_to", "source", "created_at", "updated_at"
+]
+
+
 class IssueCreate(BaseModel):
     company_id: str
     subject: str
@@ -50,7 +57,24 @@ class IssueUpdate(BaseModel):
     status: Optional[IssueStatus] = None
     attachments: Optional[List[HttpUrl]] = None
     assigned_to: Optional[str] = None
-    
+
+
+class IssueBulkItem(BaseModel):
+    id: str
+    changes: IssueUpdate
+
+
+class IssueBulkUpdate(BaseModel):
+    items: List[IssueBulkItem]
+
+
+class BulkItemStatus(str, Enum):
+    UPDATED = "updated"
+    NOT_FOUND = "not_found"
+    INVALID = "invalid"
+    # Changed by someone else between reading and writing; safe to retry
+    CONFLICT = "conflict"
+    FAILED = "failed"
 
 
 class IssueOut(BaseModel):
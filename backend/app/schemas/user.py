@@ -16,6 +16,7 @@ class GoogleUser(BaseModel):
 class TokenSave(BaseModel):
     access_token: str
     refresh_token: str
+    expires_at: Optional[int] = None  # access token expiry, unix seconds
     user: GoogleUser
 
 class UserCreate(BaseModel):
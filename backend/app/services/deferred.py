@@ -0,0 +1,170 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Awaitable, Callable, Dict, Optional
+
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from app.ai import llm_under_pressure
+from app.database import get_database
+
+DEFERRED_BATCH_SIZE = int(os.getenv("DEFERRED_BATCH_SIZE", "20"))
+DEFERRED_POLL_INTERVAL = float(os.getenv("DEFERRED_POLL_INTERVAL", "10"))
+DEFERRED_MAX_ATTEMPTS = int(os.getenv("DEFERRED_MAX_ATTEMPTS", "5"))
+DEFERRED_BACKOFF_BASE = int(os.getenv("DEFERRED_BACKOFF_BASE", "60"))
+DEFERRED_LEASE = timedelta(minutes=5)
+
+_worker_task: Optional[asyncio.Task] = None
+
+
+class DeferredKind(str, Enum):
+    # Generate and draft the reply to an inquiry
+    INQUIRY_RESPONSE = "inquiry_response"
+    # Queue the assignment and customer confirmation emails for a new issue
+    TICKET_NOTIFICATIONS = "ticket_notifications"
+
+
+class DeferredStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+# Kinds that call the LLM, and so wait while it is under pressure
+LLM_KINDS = [DeferredKind.INQUIRY_RESPONSE.value]
+
+
+async def defer(kind: DeferredKind, company_id: str, user_id: str, email_id: str, payload: Dict) -> bool:
+    """
+    Record work a sync skipped under load, to be run once there is capacity.
+    Work is deduplicated by (kind, company_id, email_id).
+
+    Returns:
+        True if recorded, False if the same work was already deferred
+    """
+    db = get_database()
+    now = datetime.utcnow()
+    key = {"kind": kind.value, "company_id": company_id, "email_id": email_id}
+
+    try:
+        result = await db.deferred_work.update_one(
+            key,
+            {
+                "$setOnInsert": {
+                    **key,
+                    "user_id": user_id,
+                    "payload": payload,
+                    "status": DeferredStatus.PENDING.value,
+                    "attempts": 0,
+                    "next_attempt_at": now,
+                    "created_at": now,
+                    "updated_at": now
+                }
+            },
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return False
+    return result.upserted_id is not None
+
+
+async def _claim_next(db) -> Optional[Dict]:
+    now = datetime.utcnow()
+    query = {
+        "$or": [
+            {"status": DeferredStatus.PENDING.value, "next_attempt_at": {"$lte": now}},
+            # Picked up by a worker that died before finishing
+            {"status": DeferredStatus.RUNNING.value, "locked_until": {"$lte": now}},
+        ]
+    }
+    if llm_under_pressure():
+        query["kind"] = {"$nin": LLM_KINDS}
+
+    return await db.deferred_work.find_one_and_update(
+        query,
+        {"$set": {"status": DeferredStatus.RUNNING.value, "locked_until": now + DEFERRED_LEASE}},
+        sort=[("next_attempt_at", ASCENDING)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def _failure_update(item: Dict, error: str, now: datetime) -> Dict:
+    attempts = item.get("attempts", 0) + 1
+    if attempts >= DEFERRED_MAX_ATTEMPTS:
+        print(f" Giving up on deferred {item['kind']} for {item['email_id']}: {error}")
+        status = DeferredStatus.FAILED.value
+    else:
+        status = DeferredStatus.PENDING.value
+
+    return {
+        "status": status,
+        "attempts": attempts,
+        "last_error": error,
+        "next_attempt_at": now + timedelta(seconds=DEFERRED_BACKOFF_BASE * 2 ** (attempts - 1)),
+        "updated_at": now
+    }
+
+
+async def process_deferred(runner: Callable[[Dict], Awaitable[None]]) -> int:
+    """
+    Run due deferred work one item at a time, stopping early if the LLM
+    comes under pressure again.
+
+    Returns:
+        Number of items attempted
+    """
+    db = get_database()
+    attempted = 0
+
+    while attempted < DEFERRED_BATCH_SIZE:
+        item = await _claim_next(db)
+        if item is None:
+            break
+        attempted += 1
+
+        try:
+            await runner(item)
+            update = {
+                "status": DeferredStatus.DONE.value,
+                "completed_at": datetime.utcnow(),
+                "updated_at": datetime.utcnow()
+            }
+        except Exception as e:
+            update = _failure_update(item, str(e), datetime.utcnow())
+        await db.deferred_work.update_one({"_id": item["_id"]}, {"$set": update})
+
+    if attempted:
+        print(f" Deferred work: ran {attempted} items")
+    return attempted
+
+
+async def _worker_loop(runner: Callable[[Dict], Awaitable[None]]):
+    while True:
+        try:
+            attempted = await process_deferred(runner)
+        except Exception as e:
+            print(f" Deferred worker error: {e}")
+            attempted = 0
+        if not attempted:
+            await asyncio.sleep(DEFERRED_POLL_INTERVAL)
+
+
+def start_deferred_worker(runner: Callable[[Dict], Awaitable[None]]):
+    """Start the background task that runs deferred work through runner"""
+    global _worker_task
+    if _worker_task is None:
+        _worker_task = asyncio.create_task(_worker_loop(runner))
+
+
+async def stop_deferred_worker():
+    global _worker_task
+    if _worker_task:
+        _worker_task.cancel()
+        try:
+            await _worker_task
+        except asyncio.CancelledError:
+            pass
+        _worker_task = None
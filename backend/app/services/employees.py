@@ -0,0 +1,173 @@
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from app.database import get_database
+from app.schemas.company import UserRole
+
+# How long a cached employee stays valid; edits through the users routes
+# invalidate it straight away
+EMPLOYEE_CACHE_TTL = float(os.getenv("EMPLOYEE_CACHE_TTL", "300"))
+EMPLOYEE_CACHE_SIZE = 5000
+# Rosters can be served a little stale across processes; within one process
+# the users routes invalidate them on every change
+ROSTER_CACHE_TTL = float(os.getenv("ROSTER_CACHE_TTL", "60"))
+ROSTER_LIMIT = 200
+
+# Fields of a user shown as an issue's assigned_user
+ASSIGNEE_FIELDS = {"name": 1, "email": 1, "department": 1, "position": 1, "skills": 1, "tags": 1}
+
+# user id -> (assigned_user dict or None if there is no such user, expires at)
+_employee_cache: Dict[str, Tuple[Optional[Dict], float]] = {}
+# company id -> (employees, expires at)
+_roster_cache: Dict[str, Tuple[List[Dict], float]] = {}
+
+
+def assignee_summary(user: Dict) -> Dict:
+    """The assigned_user shape issue endpoints return for a user document"""
+    return {
+        "id": str(user["_id"]),
+        "name": user.get("name"),
+        "email": user.get("email"),
+        "department": user.get("department"),
+        "position": user.get("position"),
+        "skills": user.get("skills", []),
+        "tags": user.get("tags", []),
+    }
+
+
+def _roster_entry(user: Dict) -> Dict:
+    return {
+        **assignee_summary(user),
+        "specialties": user.get("specialties", []),
+        "current_load": user.get("current_load", 0),
+        "max_capacity": user.get("max_capacity", 10),
+        "is_onboarded": user.get("is_onboarded", False),
+    }
+
+
+def _store(user_id: str, summary: Optional[Dict]):
+    if len(_employee_cache) >= EMPLOYEE_CACHE_SIZE:
+        _employee_cache.clear()
+    _employee_cache[user_id] = (summary, time.monotonic() + EMPLOYEE_CACHE_TTL)
+
+
+async def get_assignee(user_id: str) -> Optional[Dict]:
+    """
+    assigned_user for an issue, from the in-memory cache or MongoDB
+
+    Returns:
+        The assignee summary, or None if user_id is not a known user
+    """
+    cached = _employee_cache.get(user_id)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+
+    try:
+        oid = ObjectId(user_id)
+    except (InvalidId, TypeError):
+        return None
+
+    db = get_database()
+    user = await db.users.find_one({"_id": oid}, ASSIGNEE_FIELDS)
+    summary = assignee_summary(user) if user else None
+    _store(user_id, summary)
+    return summary
+
+
+async def get_assignees(user_ids: Iterable[str], company_id: Optional[str] = None) -> Dict[str, Dict]:
+    """
+    assigned_user for many issues at once. The company's roster answers
+    first, then the per-user cache, and whatever is left takes one query.
+
+    Returns:
+        user id -> assignee summary, for the ids that are known users
+    """
+    found: Dict[str, Dict] = {}
+    if company_id:
+        roster = {e["id"]: e for e in await get_roster(company_id)}
+    else:
+        roster = {}
+
+    now = time.monotonic()
+    missing: List[ObjectId] = []
+    for user_id in set(user_ids):
+        if user_id in roster:
+            employee = roster[user_id]
+            found[user_id] = {field: employee[field] for field in ("id", *ASSIGNEE_FIELDS)}
+            continue
+        cached = _employee_cache.get(user_id)
+        if cached and cached[1] > now:
+            if cached[0]:
+                found[user_id] = cached[0]
+            continue
+        try:
+            missing.append(ObjectId(user_id))
+        except (InvalidId, TypeError):
+            continue
+
+    if missing:
+        db = get_database()
+        users = await db.users.find({"_id": {"$in": missing}}, ASSIGNEE_FIELDS).to_list(len(missing))
+        for user in users:
+            found[str(user["_id"])] = assignee_summary(user)
+        for oid in missing:
+            _store(str(oid), found.get(str(oid)))
+
+    return found
+
+
+async def get_roster(company_id: str) -> List[Dict]:
+    """
+    A company's employees, from the in-memory cache or MongoDB
+
+    Returns:
+        One dict per employee with its profile, skills and workload. These
+        are copies, so callers may modify them.
+    """
+    cached = _roster_cache.get(company_id)
+    if cached and cached[1] > time.monotonic():
+        return [dict(e) for e in cached[0]]
+
+    db = get_database()
+    employees = await db.users.find({
+        "company_id": company_id,
+        "role": UserRole.EMPLOYEE.value
+    }).to_list(ROSTER_LIMIT)
+
+    roster = [_roster_entry(e) for e in employees]
+    _roster_cache[company_id] = (roster, time.monotonic() + ROSTER_CACHE_TTL)
+    return [dict(e) for e in roster]
+
+
+def adjust_cached_load(user_id: str, delta: int):
+    """Apply a workload change to cached rosters, so they stay current between reloads"""
+    for roster, _ in _roster_cache.values():
+        for employee in roster:
+            if employee["id"] == user_id:
+                employee["current_load"] += delta
+                return
+
+
+def invalidate_roster(company_id: Optional[str] = None):
+    """Drop a company's cached roster, or every roster when company_id is None"""
+    if company_id is None:
+        _roster_cache.clear()
+    else:
+        _roster_cache.pop(company_id, None)
+
+
+def invalidate_employee(user_id: Optional[str] = None, company_id: Optional[str] = None):
+    """
+    Drop a cached employee after it changes, or every employee when user_id
+    is None, together with the roster of company_id. Without a company_id
+    every roster is dropped, since the employee may be on any of them.
+    """
+    if user_id is None:
+        _employee_cache.clear()
+    else:
+        _employee_cache.pop(user_id, None)
+    invalidate_roster(company_id)
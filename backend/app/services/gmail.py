@@ -1,74 +1,310 @@
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
+from googleapiclient.discovery import build_from_document
+from googleapiclient import discovery_cache
 from fastapi import HTTPException
 from bson import ObjectId
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
 from app.database import get_database
+from app.services import gmail_client
+from app.services.gmail_client import refresh_credentials
+import asyncio
+import json
 import os
 
 SCOPES = [
     "https://www.googleapis.com/auth/gmail.readonly",
-    "https://www.googleapis.com/auth/gmail.send"
+    "https://www.googleapis.com/auth/gmail.send",
+    "https://www.googleapis.com/auth/gmail.modify"
 ]
 
+GMAIL_DISCOVERY_PATH = os.getenv("GMAIL_DISCOVERY_PATH")
+# Point every Gmail service somewhere other than Google, e.g. the local
+# fake in tools/fake_gmail
+GMAIL_API_ENDPOINT = os.getenv("GMAIL_API_ENDPOINT")
+SERVICE_CACHE_TTL = timedelta(seconds=int(os.getenv("GMAIL_SERVICE_CACHE_TTL", "3000")))
+# Lifetime Google gives access tokens, when a client does not say
+GOOGLE_TOKEN_LIFETIME_SECONDS = 3599
+TOKEN_REFRESH_MARGIN = timedelta(seconds=int(os.getenv("GMAIL_TOKEN_REFRESH_MARGIN", "300")))
+TOKEN_REFRESH_INTERVAL = int(os.getenv("GMAIL_TOKEN_REFRESH_INTERVAL", "60"))
+PROCESSED_LABEL = os.getenv("GMAIL_PROCESSED_LABEL", "Insights-Processed")
+BATCH_MODIFY_LIMIT = 1000
+
+_discovery_document: Optional[Dict] = None
+# user id -> (service, access token it was built with, expires at)
+_service_cache: Dict[str, Tuple[Any, str, datetime]] = {}
+# user id -> (credentials, user document)
+_credential_cache: Dict[str, Tuple[Credentials, Dict]] = {}
+# access token -> user id
+_token_index: Dict[str, str] = {}
+_refresh_locks: Dict[str, asyncio.Lock] = {}
+_refresh_task: Optional[asyncio.Task] = None
+# user id -> id of the processed label in their mailbox
+_processed_label_ids: Dict[str, str] = {}
+
+
+def load_discovery_document() -> Dict:
+    """
+    Load the Gmail v1 discovery document once.
+    Uses GMAIL_DISCOVERY_PATH when set, otherwise the copy bundled with googleapiclient,
+    and points it at GMAIL_API_ENDPOINT when that is set.
+    """
+    global _discovery_document
+    if _discovery_document is None:
+        if GMAIL_DISCOVERY_PATH:
+            with open(GMAIL_DISCOVERY_PATH) as f:
+                _discovery_document = json.load(f)
+        else:
+            _discovery_document = json.loads(discovery_cache.get_static_doc("gmail", "v1"))
+        if GMAIL_API_ENDPOINT:
+            # rootUrl also decides where batch requests go
+            _discovery_document["rootUrl"] = GMAIL_API_ENDPOINT.rstrip("/") + "/"
+            print(f"📄 Gmail API endpoint overridden: {GMAIL_API_ENDPOINT}")
+        print("📄 Loaded Gmail discovery document")
+    return _discovery_document
+
+
+def _build_credentials(user: Dict) -> Credentials:
+    return Credentials(
+        token=user["access_token"],
+        refresh_token=user.get("refresh_token"),
+        token_uri="https://oauth2.googleapis.com/token",
+        client_id=os.getenv("GOOGLE_CLIENT_ID"),
+        client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
+        scopes=SCOPES,
+        # Users saved before clients sent expires_at have no expiry; assume
+        # the token was issued when it was saved, so it gets refreshed
+        expiry=user.get("token_expiry") or (
+            (user.get("updated_at") or datetime.utcnow()) + timedelta(seconds=GOOGLE_TOKEN_LIFETIME_SECONDS)
+        ),
+    )
+
+
+def _cache_credentials(user_id: str, creds: Credentials, user: Dict):
+    _credential_cache[user_id] = (creds, user)
+    _token_index[creds.token] = user_id
+
+
+def invalidate_user_credentials(user_id: str):
+    """Drop cached credentials for a user, e.g. after they log in again"""
+    _credential_cache.pop(user_id, None)
+    _service_cache.pop(user_id, None)
+    for token in [t for t, uid in _token_index.items() if uid == user_id]:
+        del _token_index[token]
+
+
+async def _refresh_user_credentials(user_id: str, creds: Credentials, user: Dict):
+    """Refresh a user's token and write it back to MongoDB"""
+    lock = _refresh_locks.setdefault(user_id, asyncio.Lock())
+    async with lock:
+        # Another caller may have refreshed while we waited for the lock
+        if creds.valid and creds.expiry and creds.expiry > datetime.utcnow() + TOKEN_REFRESH_MARGIN:
+            return
+
+        print(f"🔄 Refreshing token for user: {user['email']}")
+        previous_token = creds.token
+        await refresh_credentials(creds)
+
+        db = get_database()
+        await db.users.update_one(
+            {"_id": user["_id"]},
+            {
+                "$set": {
+                    "access_token": creds.token,
+                    "refresh_token": creds.refresh_token,
+                    "token_expiry": creds.expiry,
+                    "updated_at": datetime.utcnow()
+                }
+            }
+        )
+        user["access_token"] = creds.token
+        user["refresh_token"] = creds.refresh_token
+        user["token_expiry"] = creds.expiry
+
+        # Clients may still present the token they logged in with, so keep the
+        # previous token resolvable and forget anything older.
+        for token in [t for t, uid in _token_index.items() if uid == user_id and t != previous_token]:
+            del _token_index[token]
+        _token_index[creds.token] = user_id
+        print(f" Token refreshed and saved for user: {user['email']}")
+
+
 async def get_user_credentials(access_token: str = None):
     """
-    Get Gmail credentials for a user from MongoDB
+    Get Gmail credentials for a user, from the in-memory cache or MongoDB
     Can search by access_token
     """
     try:
-        db = get_database()
-        
-        if access_token:
-            user = await db.users.find_one({"access_token": access_token})
-        else:
+        if not access_token:
             raise HTTPException(status_code=400, detail="access_token is required")
-        
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        if not user.get("access_token"):
-            raise HTTPException(
-                status_code=401, 
-                detail="User has not authorized Gmail access. Please login first."
-            )
-        
-        creds = Credentials(
-            token=user["access_token"],
-            refresh_token=user.get("refresh_token"),
-            token_uri="https://oauth2.googleapis.com/token",
-            client_id=os.getenv("GOOGLE_CLIENT_ID"),
-            client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
-            scopes=SCOPES,
-        )
-        
+
+        user_id = _token_index.get(access_token)
+        cached = _credential_cache.get(user_id) if user_id else None
+
+        if cached:
+            creds, user = cached
+        else:
+            db = get_database()
+            user = await db.users.find_one({"access_token": access_token})
+
+            if not user:
+                raise HTTPException(status_code=404, detail="User not found")
+
+            if not user.get("access_token"):
+                raise HTTPException(
+                    status_code=401,
+                    detail="User has not authorized Gmail access. Please login first."
+                )
+
+            user_id = str(user["_id"])
+            creds = _build_credentials(user)
+            _cache_credentials(user_id, creds, user)
+
+        # The background refresher normally gets here first; this only
+        # happens for tokens that expired while it was not running.
         if creds.expired and creds.refresh_token:
-            print(f"🔄 Refreshing token for user: {user['email']}")
-            creds.refresh(Request())
-            
-            await db.users.update_one(
-                {"_id": user["_id"]},
-                {
-                    "$set": {
-                        "access_token": creds.token,
-                        "refresh_token": creds.refresh_token,
-                        "updated_at": datetime.utcnow()
-                    }
-                }
-            )
-            print(f" Token refreshed and saved for user: {user['email']}")
-        
+            await _refresh_user_credentials(user_id, creds, user)
+
         return creds, user
-    
+
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error getting credentials: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get credentials: {str(e)}")
 
+
+async def _token_refresh_loop():
+    while True:
+        await asyncio.sleep(TOKEN_REFRESH_INTERVAL)
+        refresh_before = datetime.utcnow() + TOKEN_REFRESH_MARGIN
+
+        for user_id, (creds, user) in list(_credential_cache.items()):
+            if not creds.refresh_token or not creds.expiry or creds.expiry > refresh_before:
+                continue
+            try:
+                await _refresh_user_credentials(user_id, creds, user)
+            except Exception as e:
+                print(f" Failed to refresh token for user {user.get('email')}: {e}")
+                invalidate_user_credentials(user_id)
+
+
+def start_token_refresher():
+    """Start the background task that refreshes cached tokens before they expire"""
+    global _refresh_task
+    if _refresh_task is None:
+        _refresh_task = asyncio.create_task(_token_refresh_loop())
+
+
+async def stop_token_refresher():
+    global _refresh_task
+    if _refresh_task:
+        _refresh_task.cancel()
+        try:
+            await _refresh_task
+        except asyncio.CancelledError:
+            pass
+        _refresh_task = None
+
+
+def _get_service(user_id: str, creds: Credentials):
+    now = datetime.utcnow()
+
+    cached = _service_cache.get(user_id)
+    if cached and cached[1] == creds.token and cached[2] > now:
+        return cached[0]
+
+    expires_at = now + SERVICE_CACHE_TTL
+    if creds.expiry and creds.expiry < expires_at:
+        expires_at = creds.expiry
+
+    service = build_from_document(load_discovery_document(), credentials=creds)
+    _service_cache[user_id] = (service, creds.token, expires_at)
+    return service
+
+
 async def get_gmail_service(access_token: str = None):
     """
     Get authenticated Gmail service for a user
     """
     creds, user = await get_user_credentials(access_token=access_token)
-    service = build("gmail", "v1", credentials=creds)
-    return service, user
\ No newline at end of file
+    return _get_service(str(user["_id"]), creds), user
+
+
+async def get_gmail_service_for_user(user_id: str):
+    """
+    Get authenticated Gmail service by user ID, for background jobs that
+    have no request token
+    """
+    cached = _credential_cache.get(user_id)
+    if cached:
+        creds, user = cached
+    else:
+        db = get_database()
+        user = await db.users.find_one({"_id": ObjectId(user_id)})
+        if not user or not user.get("access_token"):
+            raise HTTPException(status_code=404, detail="User has not authorized Gmail access")
+
+        creds = _build_credentials(user)
+        _cache_credentials(user_id, creds, user)
+
+    if creds.expired and creds.refresh_token:
+        await _refresh_user_credentials(user_id, creds, user)
+
+    return _get_service(user_id, creds), user
+
+
+async def get_processed_label_id(service, user_id: str) -> str:
+    """
+    Get (creating it on first use) the label applied to processed messages
+    """
+    label_id = _processed_label_ids.get(user_id)
+    if label_id:
+        return label_id
+
+    labels = await gmail_client.execute(service.users().labels().list(userId="me"))
+    for label in labels.get("labels", []):
+        if label["name"] == PROCESSED_LABEL:
+            label_id = label["id"]
+            break
+    else:
+        label = await gmail_client.execute(service.users().labels().create(
+            userId="me",
+            body={
+                "name": PROCESSED_LABEL,
+                "labelListVisibility": "labelShow",
+                "messageListVisibility": "show"
+            }
+        ))
+        label_id = label["id"]
+        print(f" Created Gmail label {PROCESSED_LABEL}")
+
+    _processed_label_ids[user_id] = label_id
+    return label_id
+
+
+async def mark_emails_processed(service, user_id: str, message_ids: List[str]):
+    """
+    Mark messages as read and apply the processed label, up to
+    BATCH_MODIFY_LIMIT messages per batchModify call
+    """
+    if not message_ids:
+        return
+
+    add_label_ids = []
+    try:
+        add_label_ids.append(await get_processed_label_id(service, user_id))
+    except Exception as e:
+        print(f" Failed to get processed label: {e}")
+
+    for start in range(0, len(message_ids), BATCH_MODIFY_LIMIT):
+        chunk = message_ids[start:start + BATCH_MODIFY_LIMIT]
+        await gmail_client.execute(service.users().messages().batchModify(
+            userId="me",
+            body={
+                "ids": chunk,
+                "addLabelIds": add_label_ids,
+                "removeLabelIds": ["UNREAD"]
+            }
+        ))
+    print(f" Marked {len(message_ids)} emails as processed")
@@ -0,0 +1,88 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+
+import httplib2
+from google.auth.transport.requests import Request
+from google_auth_httplib2 import AuthorizedHttp
+
+from googleapiclient.errors import HttpError
+
+from app.config import GMAIL_MAX_WORKERS
+from app.services import gmail_quota
+
+# googleapiclient and httplib2 are blocking and httplib2.Http is not
+# thread-safe, so every Gmail call runs on a bounded pool where each worker
+# thread owns its own Http connection.
+_executor = ThreadPoolExecutor(max_workers=GMAIL_MAX_WORKERS, thread_name_prefix="gmail")
+_local = threading.local()
+
+
+def _thread_http() -> httplib2.Http:
+    http = getattr(_local, "http", None)
+    if http is None:
+        http = httplib2.Http()
+        _local.http = http
+    return http
+
+
+def _execute(request, credentials):
+    if credentials is None:
+        credentials = getattr(getattr(request, "http", None), "credentials", None)
+
+    http = _thread_http()
+    if credentials is not None:
+        http = AuthorizedHttp(credentials, http=http)
+
+    return request.execute(http=http)
+
+
+def _quota_key(request, credentials) -> str:
+    if credentials is None:
+        credentials = getattr(getattr(request, "http", None), "credentials", None)
+    if credentials is None:
+        return "anonymous"
+    # The refresh token outlives access token rotation, so one user keeps one bucket
+    return getattr(credentials, "refresh_token", None) or getattr(credentials, "token", None) or "anonymous"
+
+
+async def execute(request, credentials: Optional[Any] = None, units: Optional[int] = None) -> Any:
+    """
+    Execute a googleapiclient request (or batch) without blocking the event loop.
+
+    Calls are paced against the user's Gmail quota, and rate limited
+    responses (429, or 403 rateLimitExceeded) are retried with backoff.
+
+    Args:
+        request: HttpRequest or BatchHttpRequest built from a Gmail service
+        credentials: Credentials to authorize with, defaults to the ones the
+            request was built with
+        units: Quota units the call uses, looked up from the method by default
+    """
+    loop = asyncio.get_running_loop()
+    key = _quota_key(request, credentials)
+    cost = units if units is not None else gmail_quota.request_cost(request)
+
+    attempt = 0
+    while True:
+        await gmail_quota.acquire(key, cost)
+        try:
+            return await loop.run_in_executor(_executor, _execute, request, credentials)
+        except HttpError as e:
+            if not gmail_quota.is_rate_limited(e) or attempt >= gmail_quota.GMAIL_MAX_RETRIES:
+                raise
+            delay = gmail_quota.backoff_delay(e, attempt)
+            gmail_quota.penalize(key, delay)
+            print(f" Gmail rate limited ({e.resp.status}), retrying in {delay:.1f}s")
+            attempt += 1
+
+
+async def refresh_credentials(creds) -> None:
+    """Refresh OAuth credentials on the Gmail pool"""
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(_executor, creds.refresh, Request())
+
+
+def shutdown() -> None:
+    _executor.shutdown(wait=False)
@@ -0,0 +1,114 @@
+import asyncio
+import os
+import random
+import time
+from typing import Dict, Optional
+
+from googleapiclient.errors import HttpError
+
+# Gmail's per-user limit is 250 quota units per second
+GMAIL_QUOTA_UNITS_PER_SECOND = float(os.getenv("GMAIL_QUOTA_UNITS_PER_SECOND", "250"))
+GMAIL_MAX_RETRIES = int(os.getenv("GMAIL_MAX_RETRIES", "5"))
+GMAIL_BACKOFF_BASE = float(os.getenv("GMAIL_BACKOFF_BASE", "1"))
+GMAIL_BACKOFF_MAX = float(os.getenv("GMAIL_BACKOFF_MAX", "32"))
+
+# Quota units per call, from the Gmail API usage limits table
+METHOD_COSTS = {
+    "gmail.users.getProfile": 1,
+    "gmail.users.labels.list": 1,
+    "gmail.users.labels.get": 1,
+    "gmail.users.labels.create": 5,
+    "gmail.users.messages.list": 5,
+    "gmail.users.messages.get": 5,
+    "gmail.users.messages.modify": 5,
+    "gmail.users.messages.batchModify": 50,
+    "gmail.users.messages.send": 100,
+    "gmail.users.drafts.create": 10,
+    "gmail.users.threads.get": 10,
+    "gmail.users.threads.list": 10,
+}
+DEFAULT_COST = 5
+
+_RATE_LIMIT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded", "RATE_LIMIT_EXCEEDED")
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at `rate` units per second, holding at most `capacity`
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, units: float):
+        # A call larger than the bucket (e.g. a batch of sends) could never
+        # be paid up front; it goes once the bucket is full and is charged in
+        # full, leaving a debt the following calls wait out
+        needed = min(units, self.capacity)
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.tokens >= needed:
+                    self.tokens -= units
+                    return
+                await asyncio.sleep((needed - self.tokens) / self.rate)
+
+    def drain(self, seconds: float):
+        """Push the bucket into debt so the next calls wait about `seconds`"""
+        self._refill()
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+_buckets: Dict[str, TokenBucket] = {}
+
+
+def _bucket(user_key: str) -> TokenBucket:
+    bucket = _buckets.get(user_key)
+    if bucket is None:
+        bucket = TokenBucket(GMAIL_QUOTA_UNITS_PER_SECOND)
+        _buckets[user_key] = bucket
+    return bucket
+
+
+def request_cost(request) -> int:
+    """Quota units a googleapiclient request will use"""
+    return METHOD_COSTS.get(getattr(request, "methodId", None), DEFAULT_COST)
+
+
+async def acquire(user_key: str, units: int):
+    """Wait until the user's bucket can pay for `units`"""
+    await _bucket(user_key).acquire(units)
+
+
+def is_rate_limited(error: Exception) -> bool:
+    if not isinstance(error, HttpError):
+        return False
+    if error.resp.status == 429:
+        return True
+    if error.resp.status == 403:
+        details = f"{error.error_details} {error.content!r}"
+        return any(reason in details for reason in _RATE_LIMIT_REASONS)
+    return False
+
+
+def backoff_delay(error: HttpError, attempt: int) -> float:
+    """Seconds to wait before retry `attempt`, honouring Retry-After"""
+    retry_after = error.resp.get("retry-after") if hasattr(error.resp, "get") else None
+    if retry_after and str(retry_after).isdigit():
+        return float(retry_after)
+    delay = min(GMAIL_BACKOFF_MAX, GMAIL_BACKOFF_BASE * 2 ** attempt)
+    return delay + random.uniform(0, delay / 2)
+
+
+def penalize(user_key: str, seconds: float):
+    """Hold back every call for a user after Gmail rate limited one of them"""
+    _bucket(user_key).drain(seconds)
@@ -0,0 +1,857 @@
+import asyncio
+import os
+import traceback
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import UpdateOne
+
+from app.database import get_database
+from app.schemas.issues import IssueStatus, IssuePriority, IssueSource
+from app.schemas.assignments import AssignmentSource, AssignmentStatus
+from app.services import deferred, gmail_client, ledger, mime, outbox
+from app.services.deferred import DeferredKind
+from app.services.employees import get_roster
+from app.services.write_batch import WriteBatch, document_id
+from app.services.ledger import LedgerStatus
+from app.services.outbox import OutboxKind
+from app.services.gmail import mark_emails_processed, PROCESSED_LABEL
+from app.services.normalize import normalize_body
+from app.services.similarity import simhash, find_duplicate, remember, LINK_DUPLICATE_ISSUES
+from app.services.classification import classification
+from app.services.response import generate_inquiry_response
+from app.services.categorized import category
+from app.services.assignment import assign_to_employee
+from app.ai import run_llm, llm_under_pressure
+
+# Largest page messages.list will return
+MAX_PAGE_SIZE = 500
+# Time a sync may spend before it stops and leaves the rest for the next one
+SYNC_DEADLINE_SECONDS = float(os.getenv("SYNC_DEADLINE_SECONDS", "60"))
+# Share of the deadline after which replies and notifications are deferred
+SYNC_DEGRADE_AFTER = float(os.getenv("SYNC_DEGRADE_AFTER", "0.5"))
+# Write each page's documents in one transaction (needs a replica set)
+SYNC_WRITE_TRANSACTIONS = os.getenv("SYNC_WRITE_TRANSACTIONS", "false").lower() == "true"
+
+
+class SyncBudget:
+    """
+    Time budget of one sync. Once the LLM is under pressure or most of the
+    budget is spent the sync degrades: it only classifies and persists, and
+    defers reply generation and notifications.
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.deadline = asyncio.get_running_loop().time() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - asyncio.get_running_loop().time())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def degraded(self) -> bool:
+        return llm_under_pressure() or self.remaining() < self.seconds * (1 - SYNC_DEGRADE_AFTER)
+
+
+def extract_headers(msg_data: Dict) -> Dict[str, str]:
+    headers = msg_data["payload"]["headers"]
+    return {h["name"]: h["value"] for h in headers}
+
+
+def extract_body(msg_data: Dict) -> str:
+    return mime.extract_body(msg_data["payload"])
+
+
+def parse_email_message(msg_data: Dict, include_full_body: bool = False) -> Dict:
+    headers = extract_headers(msg_data)
+    body = extract_body(msg_data)
+    
+    if not include_full_body and len(body) > 1000:
+        body = body[:1000] + "..."
+    
+    return {
+        "id": msg_data["id"],
+        "subject": headers.get("Subject", "No Subject"),
+        "from": headers.get("From", "Unknown"),
+        "date": headers.get("Date", "Unknown"),
+        "snippet": msg_data.get("snippet", ""),
+        "body": body,
+        "is_unread": "UNREAD" in msg_data.get("labelIds", [])
+    }
+
+
+async def queue_draft(user_id: str, company_id: str, email_id: str, to_email: str, subject: str, body: str):
+    """Queue a reply draft to be saved in Gmail by the outbox sender"""
+    try:
+        await outbox.enqueue(
+            OutboxKind.DRAFT,
+            user_id=user_id,
+            recipient=to_email,
+            subject=subject,
+            body=body,
+            company_id=company_id,
+            email_id=email_id
+        )
+    except Exception as e:
+        print(f" Failed to queue draft: {e}")
+
+
+async def queue_assignment_email(
+    user_id: str,
+    company_id: str,
+    employee_email: str,
+    subject: str,
+    message: str,
+    category: str,
+    issue_id: str
+):
+    try:
+        email_body = f"""
+Hello,
+
+You have been assigned a new issue:
+
+Subject: {subject}
+Category: {category}
+Issue ID: {issue_id}
+
+Message:
+{message}
+
+Please review and take appropriate action.
+
+Best regards,
+Support Team
+"""
+        
+        await outbox.enqueue(
+            OutboxKind.ASSIGNMENT,
+            user_id=user_id,
+            recipient=employee_email,
+            subject=f"New Assignment: {subject}",
+            body=email_body,
+            company_id=company_id,
+            issue_id=issue_id
+        )
+        
+        print(f" Queued assignment email to {employee_email}")
+    except Exception as e:
+        print(f" Failed to queue assignment email: {e}")
+
+
+async def queue_response_to_customer(
+    user_id: str,
+    company_id: str,
+    customer_email: str,
+    subject: str,
+    body: str,
+    issue_id: str
+):
+    try:
+        await outbox.enqueue(
+            OutboxKind.CUSTOMER_RESPONSE,
+            user_id=user_id,
+            recipient=customer_email,
+            subject=f"Re: {subject}",
+            body=body,
+            company_id=company_id,
+            issue_id=issue_id
+        )
+        
+        print(f" Queued response to customer {customer_email}")
+    except Exception as e:
+        print(f" Failed to queue response to customer: {e}")
+
+
+async def send_ticket_notifications(user_id: str, company_id: str, notifications: Dict):
+    """Queue the assignee's notification and the customer's confirmation for a new issue"""
+    if notifications.get("employee_email"):
+        await queue_assignment_email(
+            user_id,
+            company_id,
+            notifications["employee_email"],
+            notifications["subject"],
+            notifications["message"],
+            notifications["category"],
+            notifications["issue_id"]
+        )
+
+    await queue_response_to_customer(
+        user_id,
+        company_id,
+        notifications["customer_email"],
+        notifications["subject"],
+        notifications["confirmation_body"],
+        notifications["issue_id"]
+    )
+
+
+def _response_context(company_info: Optional[Dict]) -> Dict:
+    return {
+        "company_name": company_info.get("name") if company_info else "Our Company",
+        "support_email": company_info.get("email") if company_info else "support@company.com",
+        "website": company_info.get("website") if company_info else "www.company.com"
+    }
+
+
+async def load_company_context(company_id: str) -> Tuple[List[Dict], Optional[Dict]]:
+    """
+    Load the employees and company details used to triage a company's emails
+    """
+    employees_list: list[Dict] = []
+    company_info: Optional[Dict] = None
+    
+    if company_id:
+        try:
+            db = get_database()
+            employees_list = await get_roster(company_id)
+
+            company_doc = await db.companies.find_one({"_id": ObjectId(company_id)})
+            if company_doc:
+                company_info = {
+                    "id": str(company_doc.get("_id")),
+                    "name": company_doc.get("name"),
+                    "email": company_doc.get("email"),
+                    "website": str(company_doc.get("website")) if company_doc.get("website") else None,
+                }
+        except Exception as e:
+            print(f" Failed to load company data: {e}")
+
+    return employees_list, company_info
+
+
+async def iter_message_pages(
+    service,
+    label_ids: List[str],
+    query: Optional[str] = None,
+    page_size: int = 100,
+    max_total: Optional[int] = None
+) -> AsyncIterator[Tuple[List[Dict], bool]]:
+    """
+    Walk messages.list page by page, for a caller that takes each page's
+    messages out of the listing (e.g. labels them processed) before asking
+    for the next one.
+
+    A page token is an offset into the result set as it was listed, so once
+    the caller has changed that set every listing starts from the top again.
+    Messages already yielded are skipped, and tokens are only followed past
+    pages that held nothing new, i.e. while the set has not changed.
+
+    Args:
+        service: Gmail service
+        label_ids: Labels every message must have
+        query: Gmail search query
+        page_size: Messages per page, capped at MAX_PAGE_SIZE
+        max_total: Stop after this many messages; None walks the whole mailbox
+
+    Yields:
+        (messages, more) for each page; more is False once the listing is
+        exhausted
+    """
+    remaining = max_total
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    seen = set()
+    page_token = None
+
+    while remaining is None or remaining > 0:
+        max_results = page_size if remaining is None else min(page_size, remaining)
+        results = await gmail_client.execute(service.users().messages().list(
+            userId="me",
+            maxResults=max_results,
+            labelIds=label_ids,
+            q=query,
+            pageToken=page_token,
+        ))
+
+        messages = [m for m in results.get("messages", []) if m["id"] not in seen]
+        page_token = results.get("nextPageToken")
+
+        if not messages:
+            # Only messages left behind earlier in this walk (e.g. released
+            # after an error); the set is unchanged, so the token is valid
+            if not page_token:
+                yield [], False
+                return
+            continue
+
+        seen.update(m["id"] for m in messages)
+        if remaining is not None:
+            remaining -= len(messages)
+
+        yield messages, bool(page_token)
+        page_token = None
+
+
+async def load_thread_issues(company_id: str, thread_ids: List[str]) -> Dict[str, str]:
+    """
+    Map Gmail thread IDs to the issues already opened for them
+    """
+    thread_ids = [t for t in set(thread_ids) if t]
+    if not thread_ids:
+        return {}
+
+    db = get_database()
+    issues = await db.issues.find(
+        {"company_id": company_id, "thread_id": {"$in": thread_ids}},
+        {"thread_id": 1}
+    ).to_list(len(thread_ids) * 2)
+    return {i["thread_id"]: str(i["_id"]) for i in issues}
+
+
+def append_to_issue(issue_id: str, company_id: str, parsed: Dict, batch: WriteBatch):
+    """
+    Record a follow-up message on an existing issue
+    """
+    now = datetime.utcnow()
+
+    # Guarded on the email id, so writing the page again adds nothing
+    batch.add_issue_update(UpdateOne(
+        {"_id": ObjectId(issue_id), "thread_messages.email_id": {"$ne": parsed["id"]}},
+        {
+            "$push": {
+                "thread_messages": {
+                    "email_id": parsed["id"],
+                    "from_email": parsed["from"],
+                    "subject": parsed["subject"],
+                    "message": parsed["body"],
+                    "received_at": now
+                }
+            },
+            "$set": {"updated_at": now}
+        }
+    ))
+    batch.add_email({
+        "email_id": parsed["id"],
+        "sender": parsed["from"],
+        "subject": parsed["subject"],
+        "body": parsed["body"],
+        "classification": "follow_up",
+        "issue_id": issue_id,
+        "thread_id": parsed.get("thread_id"),
+        "processed_at": now,
+        "company_id": company_id,
+        "status": "appended"
+    })
+
+
+async def process_message(
+    service,
+    msg: Dict,
+    user_id: str,
+    company_id: str,
+    employees_list: List[Dict],
+    company_info: Optional[Dict],
+    processed_ids: List[str],
+    thread_issues: Dict[str, str],
+    batch: WriteBatch,
+    full_raw: bool = False,
+    budget: Optional[SyncBudget] = None
+) -> Optional[Dict]:
+    """
+    Fetch and triage one message from a messages.list page, adding the
+    documents to write to batch. IDs of messages that will be fully
+    handled once the batch is flushed are appended to processed_ids.
+    Follow-ups in a thread listed in thread_issues (thread id -> issue id)
+    are appended to that issue without being triaged again.
+    LLM calls time out when the budget runs out, and a degraded budget
+    defers reply generation and notifications to the deferred worker.
+
+    Returns:
+        The parsed message with triage results, or None if it was skipped
+    """
+    msg_data = await gmail_client.execute(service.users().messages().get(
+        userId="me",
+        id=msg["id"],
+        format="full",
+    ))
+
+    if full_raw:
+        return msg_data
+
+    parsed = parse_email_message(msg_data, include_full_body=True)
+    thread_id = msg_data.get("threadId")
+    parsed["thread_id"] = thread_id
+
+    if thread_id in thread_issues:
+        issue_id = thread_issues[thread_id]
+        append_to_issue(issue_id, company_id, parsed, batch)
+        parsed["issue_id"] = issue_id
+        parsed["appended_to_issue"] = True
+        processed_ids.append(parsed["id"])
+        print(f"\n APPENDED {parsed['id']} TO ISSUE: {issue_id}")
+        return parsed
+
+    timeout = budget.remaining() if budget else None
+    degraded = budget.degraded() if budget else False
+
+    # LLM prompts only see the new content; the full body is still stored
+    normalized_body = normalize_body(parsed['body'])
+    email_text = f"From: {parsed['from']}\nSubject: {parsed['subject']}\n\n{normalized_body}"
+
+    # Near duplicates of a recently triaged email (e.g. an outage storm)
+    # reuse its classification and category instead of the LLM. Assignment
+    # always runs, so a storm is spread over the team by workload
+    fingerprint = simhash(f"{parsed['subject']}\n{normalized_body}")
+    duplicate = await find_duplicate(company_id, fingerprint)
+
+    if duplicate:
+        print(f"\n NEAR DUPLICATE of {duplicate.get('email_id')}, reusing triage")
+        classification_result = {
+            **duplicate["classification_result"],
+            "email_id": parsed["id"],
+            "duplicate_of": duplicate.get("email_id")
+        }
+        parsed["duplicate_of"] = duplicate.get("email_id")
+    else:
+        classification_result = await run_llm(classification, email=email_text, email_id=parsed["id"], timeout=timeout)
+    parsed["classification"] = classification_result
+    classification_type = classification_result.get('classification')
+
+    print(f"\n CLASSIFICATION: {classification_type} for {parsed['id']}")
+
+    triage = {"classification_result": classification_result}
+
+    if classification_type in ('none', 'spam', None):
+        print(f"Skipping {classification_type} email")
+        if not duplicate:
+            await remember(company_id, fingerprint, {**triage, "email_id": parsed["id"]})
+        return None
+
+    if classification_type == 'inquiry' and degraded:
+        batch.after_commit(
+            deferred.defer,
+            DeferredKind.INQUIRY_RESPONSE,
+            company_id,
+            user_id,
+            parsed["id"],
+            {
+                "email_text": email_text,
+                "from": parsed["from"],
+                "subject": parsed["subject"],
+                "company_info": company_info
+            }
+        )
+        parsed["deferred"] = True
+        processed_ids.append(parsed["id"])
+        await remember(company_id, fingerprint, {**triage, "email_id": parsed["id"]})
+        batch.add_email({
+            "email_id": parsed["id"],
+            "sender": parsed['from'],
+            "subject": parsed['subject'],
+            "body": parsed['body'],
+            "classification": classification_type,
+            "response": None,
+            "simhash": format(fingerprint, "016x"),
+            "triage": triage,
+            "draft_id": None,
+            "processed_at": datetime.utcnow(),
+            "company_id": company_id,
+            "status": "response_deferred"
+        })
+        print(f"\n DEFERRED RESPONSE for inquiry {parsed['id']}")
+
+    elif classification_type == 'inquiry':
+        response_result = await run_llm(
+            generate_inquiry_response,
+            email=email_text,
+            email_id=parsed["id"],
+            category=classification_type,
+            context=_response_context(company_info),
+            tone="professional",
+            timeout=timeout
+        )
+        parsed["response"] = response_result
+        print("\n GENERATED RESPONSE for inquiry")
+
+        if response_result.get("body"):
+            batch.after_commit(
+                queue_draft,
+                user_id,
+                company_id,
+                parsed["id"],
+                parsed['from'],
+                response_result.get("subject", f"Re: {parsed['subject']}"),
+                response_result.get("body")
+            )
+            processed_ids.append(parsed["id"])
+            await remember(company_id, fingerprint, {**triage, "email_id": parsed["id"]})
+            batch.add_email({
+                "email_id": parsed["id"],
+                "sender": parsed['from'],
+                "subject": parsed['subject'],
+                "body": parsed['body'],
+                "classification": classification_type,
+                "response": response_result,
+                "simhash": format(fingerprint, "016x"),
+                "triage": triage,
+                "draft_id": None,
+                "processed_at": datetime.utcnow(),
+                "company_id": company_id,
+                "status": "draft_queued"
+            })
+
+    elif classification_type == 'ticket':
+        if duplicate and duplicate.get("category_result"):
+            category_result = {**duplicate["category_result"], "email_id": parsed["id"]}
+        else:
+            category_result = await run_llm(
+                category,
+                email=email_text,
+                email_id=parsed["id"],
+                allow_new_categories=True,
+                timeout=budget.remaining() if budget else None
+            )
+        parsed["ticket_category"] = category_result
+        triage["category_result"] = category_result
+        ticket_category = category_result.get("category", "general")
+        
+        print(f"\n CATEGORY: {ticket_category}")
+
+        if employees_list:
+            assignment_result = await run_llm(
+                assign_to_employee,
+                email=email_text,
+                email_id=parsed["id"],
+                category=ticket_category,
+                employees=employees_list,
+                category_response=category_result,
+                classification_response=classification_result,
+                timeout=budget.remaining() if budget else None
+            )
+            parsed["assignment"] = assignment_result
+            
+            assigned_employee_id = assignment_result.get("assigned_to")
+            
+            if assigned_employee_id:
+                print(f"\n ASSIGNED TO: {assignment_result.get('employee_name')}")
+                
+                issue_oid = document_id(company_id, parsed["id"], "issues")
+                issue_id = str(issue_oid)
+                issue_data = {
+                    "_id": issue_oid,
+                    "company_id": company_id,
+                    "subject": parsed['subject'],
+                    "message": parsed['body'],
+                    "from_email": parsed['from'],
+                    "category": ticket_category,
+                    "priority": IssuePriority.MEDIUM.value,
+                    "status": IssueStatus.ASSIGNED.value,
+                    "source": IssueSource.EMAIL.value,
+                    "assigned_to": assigned_employee_id,
+                    "emailId": parsed["id"],
+                    "thread_id": thread_id,
+                    "created_at": datetime.utcnow(),
+                    "updated_at": datetime.utcnow()
+                }
+                
+                parent_issue_id = duplicate.get("issue_id") if duplicate and LINK_DUPLICATE_ISSUES else None
+                if parent_issue_id == issue_id:
+                    # Triaged before and released; it found its own fingerprint
+                    parent_issue_id = None
+                if parent_issue_id:
+                    issue_data["parent_issue_id"] = parent_issue_id
+
+                batch.add_issue(issue_data)
+                if thread_id:
+                    thread_issues[thread_id] = issue_id
+                if parent_issue_id:
+                    batch.add_issue_update(UpdateOne(
+                        {"_id": ObjectId(parent_issue_id), "duplicate_issue_ids": {"$ne": issue_id}},
+                        {"$inc": {"duplicate_count": 1}, "$push": {"duplicate_issue_ids": issue_id}}
+                    ))
+                parsed["issue_id"] = issue_id
+                
+                print(f"\n CREATED ISSUE: {issue_id}")
+
+                assignment_data = {
+                    "employee_id": assigned_employee_id,
+                    "company_id": company_id,
+                    "issue_id": issue_id,
+                    "subject": parsed['subject'],
+                    "message": parsed['body'],
+                    "category": ticket_category,
+                    "priority": "medium",
+                    "status": AssignmentStatus.TODO.value,
+                    "source": AssignmentSource.AUTO.value,
+                    "created_at": datetime.utcnow(),
+                    "updated_at": datetime.utcnow()
+                }
+                
+                batch.add_assignment(assignment_data)
+
+                employee = next((e for e in employees_list if e["id"] == assigned_employee_id), None)
+                confirmation_body = f"""
+Thank you for contacting us.
+
+Your issue has been received and assigned to our team. 
+
+Issue ID: {issue_id}
+Category: {ticket_category}
+
+We will get back to you shortly.
+
+Best regards,
+{company_info.get('name') if company_info else 'Support Team'}
+"""
+                notifications = {
+                    "employee_email": employee["email"] if employee else None,
+                    "customer_email": parsed['from'],
+                    "subject": parsed['subject'],
+                    "message": parsed['body'],
+                    "category": ticket_category,
+                    "issue_id": issue_id,
+                    "confirmation_body": confirmation_body
+                }
+                if degraded or (budget and budget.degraded()):
+                    batch.after_commit(deferred.defer, DeferredKind.TICKET_NOTIFICATIONS, company_id, user_id, parsed["id"], notifications)
+                    parsed["deferred"] = True
+                    print(f"\n DEFERRED NOTIFICATIONS for issue {issue_id}")
+                else:
+                    batch.after_commit(send_ticket_notifications, user_id, company_id, notifications)
+
+                processed_ids.append(parsed["id"])
+                await remember(company_id, fingerprint, {**triage, "email_id": parsed["id"], "issue_id": parent_issue_id or issue_id})
+                
+                batch.add_email({
+                    "email_id": parsed["id"],
+                    "sender": parsed['from'],
+                    "subject": parsed['subject'],
+                    "body": parsed['body'],
+                    "classification": classification_type,
+                    "category": ticket_category,
+                    "assigned_to": assigned_employee_id,
+                    "issue_id": issue_id,
+                    "thread_id": thread_id,
+                    "simhash": format(fingerprint, "016x"),
+                    "triage": triage,
+                    "processed_at": datetime.utcnow(),
+                    "company_id": company_id,
+                    "status": "processed"
+                })
+
+    return parsed
+
+
+async def run_deferred(item: Dict):
+    """
+    Finish work a degraded sync deferred. Raises so the deferred worker
+    retries it later.
+    """
+    payload = item["payload"]
+
+    if item["kind"] == DeferredKind.INQUIRY_RESPONSE.value:
+        response_result = await run_llm(
+            generate_inquiry_response,
+            email=payload["email_text"],
+            email_id=item["email_id"],
+            category="inquiry",
+            context=_response_context(payload.get("company_info")),
+            tone="professional"
+        )
+        if not response_result.get("body"):
+            raise ValueError("Response generation returned no body")
+
+        # Record the response before queueing, so the outbox sender's
+        # draft_created status is never overwritten
+        db = get_database()
+        await db.emails.update_one(
+            {"email_id": item["email_id"], "company_id": item["company_id"], "status": "response_deferred"},
+            {"$set": {"response": response_result, "status": "draft_queued"}}
+        )
+        await queue_draft(
+            item["user_id"],
+            item["company_id"],
+            item["email_id"],
+            payload["from"],
+            response_result.get("subject", f"Re: {payload['subject']}"),
+            response_result.get("body")
+        )
+
+    elif item["kind"] == DeferredKind.TICKET_NOTIFICATIONS.value:
+        await send_ticket_notifications(item["user_id"], item["company_id"], payload)
+
+
+async def sync_inbox(
+    service,
+    user_id: str,
+    company_id: str,
+    unread_only: bool = True,
+    page_size: int = 100,
+    max_total: Optional[int] = None,
+    full_raw: bool = False,
+    include_messages: bool = True,
+    deadline_seconds: Optional[float] = SYNC_DEADLINE_SECONDS
+) -> Dict:
+    """
+    Triage a mailbox page by page. Each page is processed, written in a few
+    bulk calls, and marked as processed before the next one is fetched, so
+    memory stays flat however large the backlog is.
+
+    The sync stops once deadline_seconds have passed, leaving the remaining
+    messages for the next sync, and degrades as the deadline nears or the
+    LLM comes under pressure (see SyncBudget).
+
+    Returns:
+        Dict with the processed messages (when include_messages is set),
+        counts, how much work was deferred, whether the deadline cut the
+        sync short, and has_more when unprocessed mail is left
+    """
+    budget = SyncBudget(deadline_seconds) if deadline_seconds else None
+    employees_list, company_info = await load_company_context(company_id)
+
+    label_ids = ["INBOX"]
+    if unread_only:
+        label_ids.append("UNREAD")
+
+    detailed_messages = []
+    count = 0
+    deferred_count = 0
+    listed = 0
+    deadline_exceeded = False
+    more = False
+
+    async for messages, more in iter_message_pages(
+        service,
+        label_ids,
+        query=f"-label:{PROCESSED_LABEL}",
+        page_size=page_size,
+        max_total=max_total
+    ):
+        listed += len(messages)
+        # Done by an earlier sync but never labelled, e.g. the batchModify failed
+        relabel_ids: List[str] = []
+        processed_ids: List[str] = []
+        # (message id, lease token, outcome) to complete once the batch is written
+        claimed: List[Tuple[str, str, str]] = []
+        page_messages: List[Dict] = []
+        batch = WriteBatch()
+        fatal: Optional[HTTPException] = None
+        thread_issues = await load_thread_issues(company_id, [m.get("threadId") for m in messages])
+
+        # Pages are newest first; go oldest first so the message that starts
+        # a thread opens the issue and later replies are appended to it
+        for msg in reversed(messages):
+            if budget and budget.expired():
+                deadline_exceeded = True
+                break
+
+            lease_token = None
+            if not full_raw:
+                # Claim before any Gmail or LLM work so concurrent syncs and
+                # re-runs never process the same message twice
+                lease_token, status = await ledger.claim(company_id, msg["id"])
+                if not lease_token:
+                    if status == LedgerStatus.DONE.value:
+                        relabel_ids.append(msg["id"])
+                    continue
+
+            handled_before = len(processed_ids)
+            batch.for_message(msg["id"])
+            try:
+                parsed = await process_message(
+                    service,
+                    msg,
+                    user_id,
+                    company_id,
+                    employees_list,
+                    company_info,
+                    processed_ids,
+                    thread_issues,
+                    batch,
+                    full_raw=full_raw,
+                    budget=budget
+                )
+            except HTTPException as e:
+                batch.discard_message(msg["id"])
+                if lease_token:
+                    await ledger.release(company_id, msg["id"], lease_token, str(e.detail))
+                # Still write what this page has done so far before failing
+                fatal = e
+                break
+            except Exception as e:
+                print(f"⚠️ Error processing message {msg['id']}: {str(e)}")
+                traceback.print_exc()
+                batch.discard_message(msg["id"])
+                if lease_token:
+                    await ledger.release(company_id, msg["id"], lease_token, str(e))
+                continue
+
+            if lease_token:
+                if parsed is None:
+                    claimed.append((msg["id"], lease_token, "skipped"))
+                elif len(processed_ids) > handled_before:
+                    claimed.append((msg["id"], lease_token, "processed"))
+                else:
+                    # Nothing to persist (e.g. no employee to assign to),
+                    # so leave it for a later sync
+                    await ledger.release(company_id, msg["id"], lease_token)
+
+            if parsed is not None:
+                page_messages.append(parsed)
+
+        try:
+            written, failed = await batch.flush(get_database(), transaction=SYNC_WRITE_TRANSACTIONS)
+        except Exception as e:
+            # Raised before anything was written, or by a rolled back
+            # transaction: nothing of this page counts as done
+            print(f" Failed to write page: {e}")
+            traceback.print_exc()
+            written, failed = set(), {message_id for message_id, _, _ in claimed}
+            error = str(e)
+        else:
+            error = "Failed to write documents"
+
+        # Messages with nothing written go back for the next sync, which
+        # rewrites them under the same ids. One that landed in part is
+        # done: triaging it again could pick another assignee and notify
+        # twice
+        lost = failed - written
+        for message_id in failed & written:
+            print(f" Message {message_id} was only partly written")
+        for message_id, lease_token, _ in claimed:
+            if message_id in lost:
+                await ledger.release(company_id, message_id, lease_token, error)
+        processed_ids = [message_id for message_id in processed_ids if message_id not in lost]
+        page_messages = [parsed for parsed in page_messages if parsed["id"] not in lost]
+
+        try:
+            await ledger.complete_many(company_id, [entry for entry in claimed if entry[0] not in lost])
+        except Exception as e:
+            # The documents are in place; once the leases run out a later
+            # sync finds them under the same ids
+            print(f" Failed to complete ledger entries: {e}")
+
+        count += len(page_messages)
+        deferred_count += sum(1 for parsed in page_messages if parsed.get("deferred"))
+        if include_messages:
+            detailed_messages.extend(page_messages)
+
+        try:
+            await mark_emails_processed(service, user_id, relabel_ids + processed_ids)
+        except Exception as e:
+            print(f" Failed to mark emails as processed: {e}")
+
+        if fatal:
+            raise fatal
+
+        if deadline_exceeded:
+            # Whatever is left stays unlabelled, so the next sync lists it
+            # again; messages already done there are skipped by the ledger
+            more = True
+            print(f" Sync deadline of {deadline_seconds}s reached, stopping early")
+            break
+
+    return {
+        "messages": detailed_messages,
+        "employees": employees_list,
+        "company": company_info,
+        "count": count,
+        "deferred": deferred_count,
+        "deadline_exceeded": deadline_exceeded,
+        "total_in_inbox": listed,
+        "has_more": more,
+    }
@@ -0,0 +1,135 @@
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import List, Optional, Tuple
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from app.database import get_database
+
+# How long a worker owns a message before another worker may take it over
+LEDGER_LEASE = timedelta(seconds=int(os.getenv("LEDGER_LEASE_SECONDS", "300")))
+# A message released this many times (e.g. no employee to assign it to) is
+# only retried once per cool-down, instead of on every sync
+LEDGER_MAX_ATTEMPTS = int(os.getenv("LEDGER_MAX_ATTEMPTS", "3"))
+LEDGER_RETRY_COOLDOWN = timedelta(seconds=int(os.getenv("LEDGER_RETRY_COOLDOWN_SECONDS", "3600")))
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class LedgerStatus(str, Enum):
+    PROCESSING = "processing"
+    DONE = "done"
+    RELEASED = "released"
+
+
+async def claim(company_id: str, email_id: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Claim a Gmail message for processing.
+
+    Returns:
+        (lease token, None) if claimed, otherwise (None, current status):
+        "done" if it was already processed, "processing" if another
+        worker holds an unexpired lease, "released" if it failed too often
+        and is cooling down
+    """
+    db = get_database()
+    now = datetime.utcnow()
+    token = uuid.uuid4().hex
+    lease = {
+        "status": LedgerStatus.PROCESSING.value,
+        "lease_token": token,
+        "lease_until": now + LEDGER_LEASE,
+        "worker": WORKER_ID,
+        "updated_at": now
+    }
+
+    try:
+        await db.processing_ledger.insert_one({
+            "company_id": company_id,
+            "email_id": email_id,
+            **lease,
+            "attempts": 1,
+            "created_at": now
+        })
+        return token, None
+    except DuplicateKeyError:
+        pass
+
+    entry = await db.processing_ledger.find_one_and_update(
+        {
+            "company_id": company_id,
+            "email_id": email_id,
+            "$or": [
+                {"status": LedgerStatus.RELEASED.value, "attempts": {"$lt": LEDGER_MAX_ATTEMPTS}},
+                {"status": LedgerStatus.RELEASED.value, "updated_at": {"$lte": now - LEDGER_RETRY_COOLDOWN}},
+                {"status": LedgerStatus.PROCESSING.value, "lease_until": {"$lte": now}},
+            ]
+        },
+        {"$set": lease, "$inc": {"attempts": 1}},
+        return_document=ReturnDocument.AFTER
+    )
+    if entry:
+        return token, None
+
+    existing = await db.processing_ledger.find_one(
+        {"company_id": company_id, "email_id": email_id},
+        {"status": 1}
+    )
+    return None, existing["status"] if existing else None
+
+
+async def complete(company_id: str, email_id: str, token: str, outcome: str):
+    """Mark a claimed message as processed for good"""
+    db = get_database()
+    await db.processing_ledger.update_one(
+        {"company_id": company_id, "email_id": email_id, "lease_token": token},
+        {
+            "$set": {
+                "status": LedgerStatus.DONE.value,
+                "outcome": outcome,
+                "completed_at": datetime.utcnow(),
+                "updated_at": datetime.utcnow()
+            }
+        }
+    )
+
+
+async def complete_many(company_id: str, entries: List[Tuple[str, str, str]]):
+    """Mark several claimed messages as processed, given (email_id, token, outcome)"""
+    if not entries:
+        return
+    db = get_database()
+    now = datetime.utcnow()
+    await db.processing_ledger.bulk_write([
+        UpdateOne(
+            {"company_id": company_id, "email_id": email_id, "lease_token": token},
+            {
+                "$set": {
+                    "status": LedgerStatus.DONE.value,
+                    "outcome": outcome,
+                    "completed_at": now,
+                    "updated_at": now
+                }
+            }
+        )
+        for email_id, token, outcome in entries
+    ], ordered=False)
+
+
+async def release(company_id: str, email_id: str, token: str, error: Optional[str] = None):
+    """Give up a claim so the message is picked up again by a later sync"""
+    db = get_database()
+    await db.processing_ledger.update_one(
+        {"company_id": company_id, "email_id": email_id, "lease_token": token},
+        {
+            "$set": {
+                "status": LedgerStatus.RELEASED.value,
+                "last_error": error,
+                "updated_at": datetime.utcnow()
+            }
+        }
+    )
@@ -0,0 +1,99 @@
+import base64
+import codecs
+import html
+import os
+import re
+from typing import Dict, Iterator, Optional
+
+# Upper bound on decoded body size; anything past it is never decoded
+MAX_BODY_BYTES = int(os.getenv("MAX_EMAIL_BODY_BYTES", "100000"))
+
+_CHARSET_RE = re.compile(r'charset="?([\w.:-]+)"?', re.IGNORECASE)
+_DROP_BLOCKS_RE = re.compile(r"<(script|style|head)\b.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+_COMMENT_RE = re.compile(r"<!--.*?-->", re.DOTALL)
+_BREAK_RE = re.compile(r"<br\s*/?>|</(p|div|tr|li|h[1-6]|table|blockquote)\s*>", re.IGNORECASE)
+_TAG_RE = re.compile(r"<[^>]+>")
+_SPACES_RE = re.compile(r"[ \t\r\f\v]+")
+_BLANK_LINES_RE = re.compile(r"\n\s*\n+")
+
+
+def _is_attachment(part: Dict) -> bool:
+    body = part.get("body", {})
+    return bool(part.get("filename")) or "attachmentId" in body
+
+
+def _walk(part: Dict) -> Iterator[Dict]:
+    """Depth-first walk over a payload's MIME tree, skipping attachments"""
+    if _is_attachment(part):
+        return
+    yield part
+    for child in part.get("parts", []):
+        yield from _walk(child)
+
+
+def _find_part(payload: Dict, mime_type: str) -> Optional[Dict]:
+    for part in _walk(payload):
+        if part.get("mimeType") == mime_type and part.get("body", {}).get("data"):
+            return part
+    return None
+
+
+def _charset(part: Dict) -> str:
+    for header in part.get("headers", []):
+        if header["name"].lower() == "content-type":
+            match = _CHARSET_RE.search(header["value"])
+            if match:
+                try:
+                    return codecs.lookup(match.group(1)).name
+                except LookupError:
+                    break
+    return "utf-8"
+
+
+def _decode(part: Dict, max_bytes: int) -> str:
+    data = part["body"]["data"]
+    # Every 4 base64 characters decode to 3 bytes, so cut the encoded string
+    # instead of decoding everything and throwing most of it away
+    max_chars = (max_bytes + 2) // 3 * 4
+    if len(data) > max_chars:
+        data = data[:max_chars]
+    data += "=" * (-len(data) % 4)
+    raw = base64.urlsafe_b64decode(data)[:max_bytes]
+    return raw.decode(_charset(part), errors="replace")
+
+
+def html_to_text(content: str) -> str:
+    """Cheap HTML to text conversion, good enough for triage prompts"""
+    content = _DROP_BLOCKS_RE.sub("", content)
+    content = _COMMENT_RE.sub("", content)
+    content = _BREAK_RE.sub("\n", content)
+    content = _TAG_RE.sub("", content)
+    content = html.unescape(content)
+    content = _SPACES_RE.sub(" ", content)
+    content = _BLANK_LINES_RE.sub("\n\n", content)
+    return content.strip()
+
+
+def extract_body(payload: Dict, max_bytes: int = MAX_BODY_BYTES) -> str:
+    """
+    Extract the text body of a Gmail message payload.
+
+    Walks nested multiparts, prefers text/plain anywhere in the tree over
+    text/html, and only decodes the part it picks.
+
+    Args:
+        payload: The message's "payload" from messages.get(format="full")
+        max_bytes: Maximum number of bytes to decode
+
+    Returns:
+        The body text, or "" if the message has no text part
+    """
+    part = _find_part(payload, "text/plain")
+    if part:
+        return _decode(part, max_bytes)
+
+    part = _find_part(payload, "text/html")
+    if part:
+        return html_to_text(_decode(part, max_bytes))
+
+    return ""
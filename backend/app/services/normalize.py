@@ -0,0 +1,114 @@
+import os
+import re
+
+# Rough budget for the email part of each LLM prompt
+LLM_INPUT_TOKEN_BUDGET = int(os.getenv("LLM_INPUT_TOKEN_BUDGET", "800"))
+CHARS_PER_TOKEN = 4
+
+# Start of quoted history; everything from here on is dropped
+_QUOTE_HEADER_RE = re.compile(
+    r"^(On\s[^\n]{1,200}?(\n[^\n]{0,100}?)?\s?wrote:\s*$"
+    r"|-{2,}\s*Original Message\s*-{2,}"
+    r"|-{2,}\s*Forwarded message\s*-{2,}"
+    r"|_{20,}\s*$"
+    r"|From:\s[^\n]+\n(Sent|Date):\s)",
+    re.IGNORECASE | re.MULTILINE
+)
+# Legal footers and disclaimers; everything from here on is dropped. Only
+# whole footer phrases count, a line merely starting with "Disclaimer" may
+# well be the customer's problem
+_FOOTER_RE = re.compile(
+    r"^\s*(CONFIDENTIALITY NOTICE\b"
+    r"|(DISCLAIMER|LEGAL NOTICE)\s*:\s*(This|The information)\b"
+    r"|This (e-?mail|message) and any (files|attachments)[^\n]{0,40}(is|are|may be) (confidential|intended|privileged)"
+    r"|This (e-?mail|message) (is|may be) (confidential|intended (only|solely) for)"
+    r"|The information (contained )?in this (e-?mail|message)[^\n]{0,20} (is|may be) (confidential|privileged|intended))",
+    re.IGNORECASE | re.MULTILINE
+)
+_SIGNATURE_DELIMITER_RE = re.compile(r"^-- ?$", re.MULTILINE)
+_SIGN_OFF_RE = re.compile(
+    r"^\s*(best|kind|warm)?\s*(regards|wishes|thanks|thank you|cheers|sincerely|yours truly)[,.!]?\s*$",
+    re.IGNORECASE
+)
+_MOBILE_FOOTER_RE = re.compile(r"^\s*Sent from my \w+.*$", re.IGNORECASE | re.MULTILINE)
+# Contact details that may follow a sign-off: email, phone, web address
+_CONTACT_RE = re.compile(
+    r"[\w.+-]+@[\w-]+\.[\w.]+|(\+?\d[\d\s().-]{6,}\d)|www\.|https?://|^\s*(tel|phone|mobile|cell|fax)\b",
+    re.IGNORECASE
+)
+# Lowercase words a name, title or company line may still contain
+_NAME_CONNECTORS = {"of", "and", "at", "the", "for", "&", "|", "-", "de", "van", "von"}
+# Sign-offs further up than this are part of the message, not its signature
+SIGN_OFF_WINDOW = 12
+# A signature block after the sign-off is at most this many lines
+SIGNATURE_MAX_LINES = 4
+
+
+def _cut(text: str, pattern: re.Pattern) -> str:
+    match = pattern.search(text)
+    return text[:match.start()] if match else text
+
+
+def _is_signature_line(line: str) -> bool:
+    """A short name, title, company or contact line"""
+    line = line.strip()
+    if len(line) > 60:
+        return False
+    if _CONTACT_RE.search(line):
+        return True
+    words = line.split()
+    if not words or len(words) > 6 or line.endswith("?"):
+        return False
+    return all(w[0].isupper() or w.lower() in _NAME_CONNECTORS for w in words)
+
+
+def _strip_signature(text: str) -> str:
+    text = _cut(text, _SIGNATURE_DELIMITER_RE)
+    text = _MOBILE_FOOTER_RE.sub("", text)
+
+    lines = text.rstrip().split("\n")
+    # Only the last sign-off can start the signature; anything after it
+    # must look like a name or contact block, or it is still the message
+    for i in range(len(lines) - 1, max(-1, len(lines) - 1 - SIGN_OFF_WINDOW), -1):
+        if _SIGN_OFF_RE.match(lines[i]):
+            trailer = [line for line in lines[i + 1:] if line.strip()]
+            if len(trailer) <= SIGNATURE_MAX_LINES and all(_is_signature_line(line) for line in trailer):
+                return "\n".join(lines[:i])
+            break
+    return "\n".join(lines)
+
+
+def truncate_to_budget(text: str, max_tokens: int = LLM_INPUT_TOKEN_BUDGET) -> str:
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(" ", 0, max_chars)
+    return text[:cut if cut > max_chars // 2 else max_chars].rstrip() + " ..."
+
+
+def normalize_body(body: str, max_tokens: int = LLM_INPUT_TOKEN_BUDGET) -> str:
+    """
+    Reduce an email body to the new content an LLM needs to see.
+
+    Drops quoted reply history, signatures and legal footers, then
+    truncates to a token budget.
+
+    Args:
+        body: The email body text
+        max_tokens: Approximate token budget for the result
+
+    Returns:
+        The normalized body
+    """
+    text = body.replace("\r\n", "\n")
+    text = _cut(text, _QUOTE_HEADER_RE)
+    text = "\n".join(line for line in text.split("\n") if not line.lstrip().startswith(">"))
+    text = _cut(text, _FOOTER_RE)
+    text = _strip_signature(text)
+    text = re.sub(r"\n\s*\n+", "\n\n", text).strip()
+
+    # A reply made only of quoted text is still better than nothing
+    if not text:
+        text = body.strip()
+
+    return truncate_to_budget(text, max_tokens)
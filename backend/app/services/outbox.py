@@ -0,0 +1,285 @@
+import asyncio
+import base64
+import os
+import uuid
+from datetime import datetime, timedelta
+from email.mime.text import MIMEText
+from enum import Enum
+from typing import Dict, List, Optional
+
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from app.database import get_database
+from app.services import gmail_client, gmail_quota
+from app.services.gmail import get_gmail_service_for_user
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "5"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "6"))
+OUTBOX_BACKOFF_BASE = int(os.getenv("OUTBOX_BACKOFF_BASE", "30"))
+OUTBOX_LEASE = timedelta(minutes=5)
+# Tries at writing an item's outcome before giving up on it
+OUTBOX_RECORD_ATTEMPTS = 3
+
+_sender_task: Optional[asyncio.Task] = None
+
+
+class OutboxKind(str, Enum):
+    DRAFT = "draft"
+    ASSIGNMENT = "assignment"
+    CUSTOMER_RESPONSE = "customer_response"
+
+
+class OutboxStatus(str, Enum):
+    PENDING = "pending"
+    SENDING = "sending"
+    SENT = "sent"
+    FAILED = "failed"
+
+
+async def enqueue(
+    kind: OutboxKind,
+    user_id: str,
+    recipient: str,
+    subject: str,
+    body: str,
+    company_id: Optional[str] = None,
+    issue_id: Optional[str] = None,
+    email_id: Optional[str] = None
+) -> bool:
+    """
+    Queue an outbound draft or email to be sent from user_id's mailbox.
+    Messages are deduplicated by (kind, issue_id, email_id, recipient).
+
+    Returns:
+        True if queued, False if an identical message was already queued
+    """
+    db = get_database()
+    now = datetime.utcnow()
+    key = {
+        "kind": kind.value,
+        "issue_id": issue_id,
+        "email_id": email_id,
+        "recipient": recipient,
+    }
+
+    try:
+        result = await db.outbox.update_one(
+            key,
+            {
+                "$setOnInsert": {
+                    **key,
+                    "user_id": user_id,
+                    "company_id": company_id,
+                    "subject": subject,
+                    "body": body,
+                    "status": OutboxStatus.PENDING.value,
+                    "attempts": 0,
+                    "next_attempt_at": now,
+                    "created_at": now,
+                    "updated_at": now
+                }
+            },
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return False
+
+    if result.upserted_id is None:
+        print(f" Skipped duplicate {kind.value} to {recipient}")
+        return False
+    return True
+
+
+def _build_raw(recipient: str, subject: str, body: str) -> str:
+    message = MIMEText(body)
+    message['to'] = recipient
+    message['subject'] = subject
+    return base64.urlsafe_b64encode(message.as_bytes()).decode()
+
+
+async def _claim_due(db) -> List[Dict]:
+    now = datetime.utcnow()
+    due = await db.outbox.find(
+        {
+            "$or": [
+                {"status": OutboxStatus.PENDING.value, "next_attempt_at": {"$lte": now}},
+                # Picked up by a sender that died before finishing
+                {"status": OutboxStatus.SENDING.value, "locked_until": {"$lte": now}},
+            ]
+        },
+        {"_id": 1}
+    ).sort("next_attempt_at", ASCENDING).limit(OUTBOX_BATCH_SIZE).to_list(OUTBOX_BATCH_SIZE)
+
+    if not due:
+        return []
+
+    claim_id = uuid.uuid4().hex
+    await db.outbox.update_many(
+        {
+            "_id": {"$in": [d["_id"] for d in due]},
+            "$or": [
+                {"status": OutboxStatus.PENDING.value},
+                {"status": OutboxStatus.SENDING.value, "locked_until": {"$lte": now}},
+            ]
+        },
+        {
+            "$set": {
+                "status": OutboxStatus.SENDING.value,
+                "claimed_by": claim_id,
+                "locked_until": now + OUTBOX_LEASE
+            }
+        }
+    )
+    return await db.outbox.find({"claimed_by": claim_id}).to_list(OUTBOX_BATCH_SIZE)
+
+
+def _failure_update(item: Dict, error: str, now: datetime) -> Dict:
+    attempts = item.get("attempts", 0) + 1
+    if attempts >= OUTBOX_MAX_ATTEMPTS:
+        print(f" Giving up on {item['kind']} to {item['recipient']}: {error}")
+        status = OutboxStatus.FAILED.value
+    else:
+        status = OutboxStatus.PENDING.value
+
+    return {
+        "status": status,
+        "attempts": attempts,
+        "last_error": error,
+        "next_attempt_at": now + timedelta(seconds=OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1)),
+        "updated_at": now
+    }
+
+
+async def _record(db, item: Dict, update: Dict):
+    # Bookkeeping for one item; a failure is logged and never fails the
+    # rest of the batch
+    for attempt in range(OUTBOX_RECORD_ATTEMPTS):
+        try:
+            await db.outbox.update_one({"_id": item["_id"]}, update)
+            return
+        except PyMongoError as e:
+            if attempt + 1 == OUTBOX_RECORD_ATTEMPTS:
+                print(f" Failed to record outbox item {item['_id']}: {e}")
+
+
+async def _record_failures(db, items: List[Dict], error: str, now: datetime):
+    for item in items:
+        await _record(db, item, {"$set": _failure_update(item, error, now)})
+
+
+async def _send_user_batch(db, user_id: str, items: List[Dict]):
+    now = datetime.utcnow()
+    try:
+        service, _ = await get_gmail_service_for_user(user_id)
+    except Exception as e:
+        error = getattr(e, "detail", None) or str(e)
+        await _record_failures(db, items, error, now)
+        return
+
+    results: Dict[str, Dict] = {}
+
+    def on_response(request_id, response, exception):
+        results[request_id] = {"response": response, "exception": exception}
+
+    batch = service.new_batch_http_request(callback=on_response)
+    units = 0
+    for item in items:
+        raw = _build_raw(item["recipient"], item["subject"], item["body"])
+        if item["kind"] == OutboxKind.DRAFT.value:
+            request = service.users().drafts().create(userId="me", body={"message": {"raw": raw}})
+        else:
+            request = service.users().messages().send(userId="me", body={"raw": raw})
+        units += gmail_quota.request_cost(request)
+        batch.add(request, request_id=str(item["_id"]))
+
+    try:
+        # A batch is charged for each part it carries, against the user's
+        # quota, and is authorized as that user
+        await gmail_client.execute(batch, credentials=request.http.credentials, units=units)
+    except Exception as e:
+        await _record_failures(db, items, str(e), now)
+        return
+
+    # Each message is marked sent on its own, before its email is updated,
+    # so a failing write cannot leave messages that went out claimed and
+    # send them again once the lease runs out
+    for item in items:
+        result = results.get(str(item["_id"]), {"response": None, "exception": "No response in batch"})
+        if result["exception"] is not None:
+            await _record(db, item, {"$set": _failure_update(item, str(result["exception"]), now)})
+            continue
+
+        gmail_id = (result["response"] or {}).get("id")
+        await _record(db, item, {
+            "$set": {
+                "status": OutboxStatus.SENT.value,
+                "gmail_id": gmail_id,
+                "sent_at": now,
+                "updated_at": now
+            },
+            "$inc": {"attempts": 1}
+        })
+
+        if item["kind"] == OutboxKind.DRAFT.value and item.get("email_id"):
+            try:
+                await db.emails.update_one(
+                    {"email_id": item["email_id"], "company_id": item.get("company_id")},
+                    {"$set": {"draft_id": gmail_id, "status": "draft_created"}}
+                )
+            except PyMongoError as e:
+                print(f" Failed to record draft {gmail_id} on email {item['email_id']}: {e}")
+
+
+async def process_outbox() -> int:
+    """
+    Send one batch of due outbox messages, grouped into one Gmail batch
+    request per sending mailbox.
+
+    Returns:
+        Number of messages attempted
+    """
+    db = get_database()
+    items = await _claim_due(db)
+    if not items:
+        return 0
+
+    by_user: Dict[str, List[Dict]] = {}
+    for item in items:
+        by_user.setdefault(item["user_id"], []).append(item)
+
+    for user_id, user_items in by_user.items():
+        await _send_user_batch(db, user_id, user_items)
+
+    print(f" Outbox: processed {len(items)} messages")
+    return len(items)
+
+
+async def _sender_loop():
+    while True:
+        try:
+            attempted = await process_outbox()
+        except Exception as e:
+            print(f" Outbox sender error: {e}")
+            attempted = 0
+        if not attempted:
+            await asyncio.sleep(OUTBOX_POLL_INTERVAL)
+
+
+def start_outbox_sender():
+    """Start the background task that drains the outbox"""
+    global _sender_task
+    if _sender_task is None:
+        _sender_task = asyncio.create_task(_sender_loop())
+
+
+async def stop_outbox_sender():
+    global _sender_task
+    if _sender_task:
+        _sender_task.cancel()
+        try:
+            await _sender_task
+        except asyncio.CancelledError:
+            pass
+        _sender_task = None
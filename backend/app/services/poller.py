@@ -0,0 +1,202 @@
+import asyncio
+import os
+import traceback
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from pymongo import ASCENDING, ReturnDocument
+
+from app.database import get_database
+from app.services.gmail import get_gmail_service_for_user
+from app.services.inbox import sync_inbox
+
+POLLER_ENABLED = os.getenv("POLLER_ENABLED", "true").lower() == "true"
+# Mailboxes synced at the same time across all tenants
+POLLER_MAX_CONCURRENCY = int(os.getenv("POLLER_MAX_CONCURRENCY", "4"))
+POLLER_TICK = float(os.getenv("POLLER_TICK", "5"))
+# Most messages one poll may take from a tenant before yielding to others
+POLL_BATCH_CAP = int(os.getenv("POLL_BATCH_CAP", "100"))
+POLL_MIN_INTERVAL = int(os.getenv("POLL_MIN_INTERVAL", "30"))
+POLL_MAX_INTERVAL = int(os.getenv("POLL_MAX_INTERVAL", "900"))
+# Messages we aim to pick up per poll when sizing the interval
+POLL_TARGET_BATCH = int(os.getenv("POLL_TARGET_BATCH", "10"))
+# Weight of the latest poll in the arrival rate moving average
+ARRIVAL_RATE_ALPHA = 0.3
+POLL_LEASE = timedelta(minutes=10)
+
+_poller_task: Optional[asyncio.Task] = None
+_in_flight: Dict[str, asyncio.Task] = {}
+
+
+async def register_mailbox(company_id: str, user_id: str) -> Dict:
+    """
+    Register (or re-enable) a company's mailbox for background polling,
+    read through user_id's Gmail account
+    """
+    db = get_database()
+    now = datetime.utcnow()
+    return await db.mailboxes.find_one_and_update(
+        {"company_id": company_id},
+        {
+            "$set": {
+                "user_id": user_id,
+                "enabled": True,
+                "next_poll_at": now,
+                "updated_at": now
+            },
+            "$setOnInsert": {
+                "company_id": company_id,
+                "interval_seconds": POLL_MIN_INTERVAL,
+                "arrival_rate": 0.0,
+                "created_at": now
+            }
+        },
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def unregister_mailbox(company_id: str) -> bool:
+    db = get_database()
+    result = await db.mailboxes.update_one(
+        {"company_id": company_id},
+        {"$set": {"enabled": False, "updated_at": datetime.utcnow()}}
+    )
+    return result.matched_count > 0
+
+
+def next_interval(arrival_rate: float, backlog: bool) -> int:
+    """
+    Seconds until the next poll: long enough to collect about
+    POLL_TARGET_BATCH messages at the current arrival rate, and as soon
+    as allowed while a backlog remains
+    """
+    if backlog:
+        return POLL_MIN_INTERVAL
+    if arrival_rate <= 0:
+        return POLL_MAX_INTERVAL
+    return int(min(POLL_MAX_INTERVAL, max(POLL_MIN_INTERVAL, POLL_TARGET_BATCH / arrival_rate)))
+
+
+async def _claim(mailbox: Dict) -> bool:
+    db = get_database()
+    now = datetime.utcnow()
+    claimed = await db.mailboxes.find_one_and_update(
+        {
+            "_id": mailbox["_id"],
+            "enabled": True,
+            "next_poll_at": {"$lte": now},
+            "$or": [{"locked_until": None}, {"locked_until": {"$lte": now}}]
+        },
+        {"$set": {"locked_until": now + POLL_LEASE}}
+    )
+    return claimed is not None
+
+
+async def poll_mailbox(mailbox: Dict):
+    """Sync one mailbox and schedule its next poll"""
+    db = get_database()
+    company_id = mailbox["company_id"]
+    started = datetime.utcnow()
+    update = {"locked_until": None, "last_polled_at": started}
+
+    try:
+        service, _ = await get_gmail_service_for_user(mailbox["user_id"])
+        result = await sync_inbox(
+            service,
+            mailbox["user_id"],
+            company_id,
+            page_size=min(POLL_BATCH_CAP, 100),
+            max_total=POLL_BATCH_CAP,
+            include_messages=False
+        )
+        # Messages handled by this poll. The listing also holds messages
+        # left unlabelled on purpose (e.g. released for lack of an
+        # employee), which would keep the rate up forever
+        arrived = result["count"]
+
+        last_polled_at = mailbox.get("last_polled_at")
+        elapsed = (started - last_polled_at).total_seconds() if last_polled_at else mailbox.get("interval_seconds", POLL_MIN_INTERVAL)
+        sample = arrived / max(elapsed, 1)
+        arrival_rate = ARRIVAL_RATE_ALPHA * sample + (1 - ARRIVAL_RATE_ALPHA) * mailbox.get("arrival_rate", 0.0)
+        backlog = arrived >= POLL_BATCH_CAP or result["deadline_exceeded"]
+        interval = next_interval(arrival_rate, backlog=backlog)
+
+        update.update({
+            "arrival_rate": arrival_rate,
+            "interval_seconds": interval,
+            "last_count": arrived,
+            "last_error": None,
+        })
+        print(f" Polled {company_id}: {arrived} messages, next poll in {interval}s")
+    except Exception as e:
+        print(f" Failed to poll mailbox {company_id}: {e}")
+        traceback.print_exc()
+        interval = min(POLL_MAX_INTERVAL, mailbox.get("interval_seconds", POLL_MIN_INTERVAL) * 2)
+        update.update({"interval_seconds": interval, "last_error": str(getattr(e, "detail", e))})
+
+    update["next_poll_at"] = datetime.utcnow() + timedelta(seconds=interval)
+    await db.mailboxes.update_one({"_id": mailbox["_id"]}, {"$set": update})
+
+
+async def _dispatch_due():
+    """
+    Start polls for due mailboxes, earliest deadline first, with at most
+    one poll per tenant and POLLER_MAX_CONCURRENCY overall. A tenant that
+    just finished goes to the back of the queue behind everyone already due.
+    """
+    free = POLLER_MAX_CONCURRENCY - len(_in_flight)
+    if free <= 0:
+        return
+
+    db = get_database()
+    now = datetime.utcnow()
+    # Same conditions as _claim, so mailboxes another process holds do not
+    # take the slots of tenants that are due
+    due = await db.mailboxes.find({
+        "enabled": True,
+        "next_poll_at": {"$lte": now},
+        "$or": [{"locked_until": None}, {"locked_until": {"$lte": now}}]
+    }).sort("next_poll_at", ASCENDING).limit(free + len(_in_flight)).to_list(free + len(_in_flight))
+
+    for mailbox in due:
+        if free <= 0:
+            break
+        company_id = mailbox["company_id"]
+        if company_id in _in_flight or not await _claim(mailbox):
+            continue
+
+        task = asyncio.create_task(poll_mailbox(mailbox))
+        _in_flight[company_id] = task
+        task.add_done_callback(lambda _, cid=company_id: _in_flight.pop(cid, None))
+        free -= 1
+
+
+async def _poller_loop():
+    while True:
+        try:
+            await _dispatch_due()
+        except Exception as e:
+            print(f" Poller error: {e}")
+        await asyncio.sleep(POLLER_TICK)
+
+
+def start_poller():
+    """Start the background mailbox poller"""
+    global _poller_task
+    if POLLER_ENABLED and _poller_task is None:
+        _poller_task = asyncio.create_task(_poller_loop())
+
+
+async def stop_poller():
+    global _poller_task
+    if _poller_task:
+        _poller_task.cancel()
+        try:
+            await _poller_task
+        except asyncio.CancelledError:
+            pass
+        _poller_task = None
+
+    for task in list(_in_flight.values()):
+        task.cancel()
@@ -0,0 +1,263 @@
+"""
+Per-company, per-day analytics rollups for dashboards.
+
+A periodic $merge aggregation folds issues (by the day they were created) and
+emails (by the day they were processed) into one daily_stats document per
+company and day, so a dashboard reads a few small documents instead of
+scanning the issues and emails collections.
+
+The first refresh covers the whole history. After that each refresh
+recomputes the last ROLLUP_WINDOW_DAYS days, plus older days with issues
+updated since the previous refresh, e.g. one closed today, and days marked
+with mark_day_dirty, e.g. by deleting an issue.
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from app.database import get_database
+
+ROLLUP_INTERVAL = float(os.getenv("ROLLUP_INTERVAL", "300"))
+ROLLUP_WINDOW_DAYS = int(os.getenv("ROLLUP_WINDOW_DAYS", "2"))
+DAY_FORMAT = "%Y-%m-%d"
+
+# Source collection -> day field and the breakdowns counted for each day
+ROLLUPS: Dict[str, Dict] = {
+    "issues": {
+        "date_field": "created_at",
+        "dimensions": {
+            "by_status": "status",
+            "by_category": "category",
+            "by_priority": "priority",
+            "by_assignee": "assigned_to",
+        },
+    },
+    "emails": {
+        "date_field": "processed_at",
+        "dimensions": {
+            "by_status": "status",
+            "by_classification": "classification",
+        },
+    },
+}
+
+_worker_task: Optional[asyncio.Task] = None
+
+
+def _breakdown(field: str) -> Dict:
+    # Counts per value of field across the day's cells, as {value: count}
+    return {
+        "$arrayToObject": {
+            "$map": {
+                "input": {"$setUnion": [f"$cells.{field}"]},
+                "as": "value",
+                "in": {
+                    "k": "$$value",
+                    "v": {
+                        "$sum": {
+                            "$map": {
+                                "input": {"$filter": {"input": "$cells", "cond": {"$eq": [f"$$this.{field}", "$$value"]}}},
+                                "in": "$$this.n",
+                            }
+                        }
+                    },
+                },
+            }
+        }
+    }
+
+
+def rollup_pipeline(source: str, match: Dict, refreshed_at: datetime) -> List[Dict]:
+    """
+    Aggregation that recounts source's documents matching match and merges
+    the counts into daily_stats under the source's name
+    """
+    config = ROLLUPS[source]
+    date_field = config["date_field"]
+    dimensions = config["dimensions"]
+
+    cell_key = {"company_id": "$company_id", "day": {"$dateToString": {"format": DAY_FORMAT, "date": f"${date_field}"}}}
+    for field in dimensions.values():
+        # Missing values would be null keys, which $arrayToObject rejects
+        cell_key[field] = {"$toString": {"$ifNull": [f"${field}", "none"]}}
+
+    section = {"total": "$total", "refreshed_at": refreshed_at}
+    for name, field in dimensions.items():
+        section[name] = _breakdown(field)
+
+    return [
+        {"$match": {"$and": [match, {"company_id": {"$nin": [None, ""]}}]}},
+        # One cell per combination of values, then fold the cells per day
+        {"$group": {"_id": cell_key, "n": {"$sum": 1}}},
+        {
+            "$group": {
+                "_id": {"company_id": "$_id.company_id", "day": "$_id.day"},
+                "total": {"$sum": "$n"},
+                "cells": {"$push": {**{field: f"$_id.{field}" for field in dimensions.values()}, "n": "$n"}},
+            }
+        },
+        {"$project": {"_id": 0, "company_id": "$_id.company_id", "day": "$_id.day", source: section}},
+        {
+            "$merge": {
+                "into": "daily_stats",
+                "on": ["company_id", "day"],
+                "whenMatched": "merge",
+                "whenNotMatched": "insert",
+            }
+        },
+    ]
+
+
+def _day_range(day: str) -> Tuple[datetime, datetime]:
+    start = datetime.strptime(day, DAY_FORMAT)
+    return start, start + timedelta(days=1)
+
+
+async def _touched_days(db, since: datetime, window_start: datetime) -> List[Dict]:
+    # (company, day) pairs before the window whose issues changed since the
+    # previous refresh
+    pipeline = [
+        {"$match": {"updated_at": {"$gte": since}, "created_at": {"$lt": window_start, "$type": "date"}}},
+        {"$group": {"_id": {"company_id": "$company_id", "day": {"$dateToString": {"format": DAY_FORMAT, "date": "$created_at"}}}}},
+    ]
+    return [row["_id"] async for row in db.issues.aggregate(pipeline)]
+
+
+async def mark_day_dirty(company_id: str, created_at: datetime):
+    """
+    Have the next refresh recompute a company's day, for changes that leave
+    no updated_at behind, like a deleted issue
+    """
+    if not company_id or not isinstance(created_at, datetime):
+        return
+    db = get_database()
+    await db.rollup_dirty.update_one(
+        {"company_id": company_id, "day": created_at.strftime(DAY_FORMAT)},
+        {"$set": {"marked_at": datetime.utcnow()}},
+        upsert=True
+    )
+
+
+async def _dirty_days(db, now: datetime) -> List[Dict]:
+    return [
+        {"company_id": row["company_id"], "day": row["day"]}
+        async for row in db.rollup_dirty.find({"marked_at": {"$lte": now}})
+    ]
+
+
+async def refresh_rollups(now: Optional[datetime] = None) -> Dict[str, int]:
+    """
+    Recompute daily_stats for recent and recently touched days
+
+    Returns:
+        Number of days recomputed per scope: "window" (days in the trailing
+        window, for every company) and "touched" (older company days)
+    """
+    db = get_database()
+    now = now or datetime.utcnow()
+    # Stored dates keep milliseconds only; match what comes back
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    window_start = datetime(now.year, now.month, now.day) - timedelta(days=ROLLUP_WINDOW_DAYS - 1)
+
+    state = await db.rollup_state.find_one({"_id": "daily_stats"})
+    since = state["refreshed_at"] if state else None
+    if since is None:
+        # First refresh: build the rollups for the whole history
+        window_start = datetime(1970, 1, 1)
+
+    touched = await _touched_days(db, since, window_start) if since else []
+    for day in await _dirty_days(db, now):
+        if day not in touched and day["day"] < window_start.strftime(DAY_FORMAT):
+            touched.append(day)
+    scopes = [{"day": {"$gte": window_start.strftime(DAY_FORMAT)}}]
+    scopes += [{"company_id": t["company_id"], "day": t["day"]} for t in touched]
+
+    for source, config in ROLLUPS.items():
+        date_field = config["date_field"]
+        match = {"$or": [{date_field: {"$gte": window_start}}]}
+        for t in touched:
+            start, end = _day_range(t["day"])
+            match["$or"].append({"company_id": t["company_id"], date_field: {"$gte": start, "$lt": end}})
+
+        async for _ in db[source].aggregate(rollup_pipeline(source, match, now), allowDiskUse=True):
+            pass
+
+        # Sections not rewritten by this refresh have no documents left
+        await db.daily_stats.update_many(
+            {"$or": scopes, f"{source}.refreshed_at": {"$lt": now}},
+            {"$unset": {source: ""}}
+        )
+
+    await db.daily_stats.delete_many({"$or": scopes, **{source: {"$exists": False} for source in ROLLUPS}})
+    await db.rollup_state.update_one({"_id": "daily_stats"}, {"$set": {"refreshed_at": now}}, upsert=True)
+    # Days marked while this refresh ran stay for the next one
+    await db.rollup_dirty.delete_many({"marked_at": {"$lte": now}})
+
+    return {"window": ROLLUP_WINDOW_DAYS, "touched": len(touched)}
+
+
+def _add_counts(totals: Dict, section: Dict):
+    for key, value in section.items():
+        if key == "refreshed_at":
+            continue
+        if isinstance(value, dict):
+            _add_counts(totals.setdefault(key, {}), value)
+        else:
+            totals[key] = totals.get(key, 0) + value
+
+
+async def company_stats(company_id: str, start_day: str, end_day: str, db=None) -> Dict:
+    """
+    A company's rollups for the days from start_day to end_day (inclusive,
+    YYYY-MM-DD), with the counts summed over the whole range
+
+    Returns:
+        Dict with per-day documents, the range totals and when the rollups
+        were last refreshed
+    """
+    db = db if db is not None else get_database()
+    days = await db.daily_stats.find(
+        {"company_id": company_id, "day": {"$gte": start_day, "$lte": end_day}},
+        {"_id": 0}
+    ).sort("day", 1).to_list(length=None)
+
+    totals: Dict[str, Dict] = {source: {"total": 0} for source in ROLLUPS}
+    refreshed_at = None
+    for day in days:
+        for source in ROLLUPS:
+            if source in day:
+                _add_counts(totals[source], day[source])
+                stamp = day[source].get("refreshed_at")
+                if stamp and (refreshed_at is None or stamp > refreshed_at):
+                    refreshed_at = stamp
+
+    return {"days": days, "totals": totals, "refreshed_at": refreshed_at}
+
+
+async def _worker_loop():
+    while True:
+        try:
+            result = await refresh_rollups()
+            print(f" Rollups refreshed ({result['touched']} older days touched)")
+        except Exception as e:
+            print(f" Rollup refresh error: {e}")
+        await asyncio.sleep(ROLLUP_INTERVAL)
+
+
+def start_rollup_worker():
+    """Start the background task that refreshes the daily rollups"""
+    global _worker_task
+    if _worker_task is None:
+        _worker_task = asyncio.create_task(_worker_loop())
+
+
+async def stop_rollup_worker():
+    global _worker_task
+    if _worker_task:
+        _worker_task.cancel()
+        try:
+            await _worker_task
+        except asyncio.CancelledError:
+            pass
+        _worker_task = None
@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+import os
+import re
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Deque, Dict, List, Optional, Tuple
+
+from app.database import get_database
+
+# Max Hamming distance between 64-bit fingerprints to count as a duplicate.
+# Emails are short, so this sits above the usual web-page value of 3.
+# The index splits fingerprints into SIMHASH_THRESHOLD + 1 bands, so any
+# match within the threshold shares at least one band exactly.
+SIMHASH_THRESHOLD = int(os.getenv("SIMHASH_THRESHOLD", "8"))
+SIMHASH_INDEX_SIZE = int(os.getenv("SIMHASH_INDEX_SIZE", "2000"))
+SIMHASH_WINDOW = timedelta(hours=int(os.getenv("SIMHASH_WINDOW_HOURS", "24")))
+LINK_DUPLICATE_ISSUES = os.getenv("SIMHASH_LINK_DUPLICATES", "true").lower() == "true"
+
+_WORD_RE = re.compile(r"\w+")
+_BANDS = SIMHASH_THRESHOLD + 1
+_BAND_BITS = 64 // _BANDS
+
+_indexes: Dict[str, "SimHashIndex"] = {}
+# company id -> warm-up in progress
+_warming: Dict[str, asyncio.Future] = {}
+
+
+def _hash64(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "big")
+
+
+def simhash(text: str) -> int:
+    """
+    64-bit SimHash over word trigrams of the text
+    """
+    words = _WORD_RE.findall(text.lower())
+    if len(words) >= 3:
+        features = [" ".join(words[i:i + 3]) for i in range(len(words) - 2)]
+    else:
+        features = words
+
+    weights = [0] * 64
+    for feature in features:
+        h = _hash64(feature)
+        for bit in range(64):
+            weights[bit] += 1 if h >> bit & 1 else -1
+
+    fingerprint = 0
+    for bit in range(64):
+        if weights[bit] > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def _bands(fingerprint: int) -> List[Tuple[int, int]]:
+    mask = (1 << _BAND_BITS) - 1
+    return [(i, fingerprint >> (i * _BAND_BITS) & mask) for i in range(_BANDS)]
+
+
+class SimHashIndex:
+    """
+    Bounded, time-windowed index of recent triage results by fingerprint
+    """
+
+    def __init__(self, max_size: int = SIMHASH_INDEX_SIZE, window: timedelta = SIMHASH_WINDOW):
+        self.window = window
+        self.entries: Deque[Dict] = deque()
+        self.max_size = max_size
+        self.buckets: Dict[Tuple[int, int], List[Dict]] = {}
+
+    def add(self, fingerprint: int, result: Dict, at: Optional[datetime] = None):
+        entry = {"fingerprint": fingerprint, "at": at or datetime.utcnow(), **result}
+        self.entries.append(entry)
+        for band in _bands(fingerprint):
+            self.buckets.setdefault(band, []).append(entry)
+
+        while len(self.entries) > self.max_size:
+            self._evict(self.entries.popleft())
+
+    def _evict(self, entry: Dict):
+        for band in _bands(entry["fingerprint"]):
+            bucket = self.buckets.get(band)
+            if bucket:
+                bucket.remove(entry)
+                if not bucket:
+                    del self.buckets[band]
+
+    def find(self, fingerprint: int, threshold: int = SIMHASH_THRESHOLD) -> Optional[Dict]:
+        cutoff = datetime.utcnow() - self.window
+        best = None
+        best_distance = threshold + 1
+        for band in _bands(fingerprint):
+            for entry in self.buckets.get(band, []):
+                if entry["at"] < cutoff:
+                    continue
+                distance = hamming_distance(fingerprint, entry["fingerprint"])
+                if distance < best_distance:
+                    best, best_distance = entry, distance
+        return best
+
+
+async def _warm_index(company_id: str) -> SimHashIndex:
+    index = SimHashIndex()
+    db = get_database()
+    recent = await db.emails.find(
+        {
+            "company_id": company_id,
+            "simhash": {"$exists": True},
+            "processed_at": {"$gte": datetime.utcnow() - SIMHASH_WINDOW}
+        },
+        {"simhash": 1, "triage": 1, "issue_id": 1, "email_id": 1, "processed_at": 1}
+    ).sort("processed_at", -1).limit(SIMHASH_INDEX_SIZE).to_list(SIMHASH_INDEX_SIZE)
+
+    for doc in reversed(recent):
+        if doc.get("triage"):
+            index.add(
+                int(doc["simhash"], 16),
+                {**doc["triage"], "email_id": doc.get("email_id"), "issue_id": doc.get("issue_id")},
+                at=doc["processed_at"]
+            )
+    return index
+
+
+async def get_company_index(company_id: str) -> SimHashIndex:
+    """
+    Get a company's index, warming it from recently processed emails on first use.
+    Callers arriving during the warm-up wait for it rather than see a partial index.
+    """
+    index = _indexes.get(company_id)
+    if index is not None:
+        return index
+
+    warming = _warming.get(company_id)
+    if warming is None:
+        warming = asyncio.ensure_future(_warm_index(company_id))
+        _warming[company_id] = warming
+
+        def _done(task: asyncio.Future):
+            _warming.pop(company_id, None)
+            if not task.cancelled() and task.exception() is None:
+                _indexes[company_id] = task.result()
+
+        warming.add_done_callback(_done)
+
+    # Shielded so one caller timing out does not cancel the warm-up for the others
+    return await asyncio.shield(warming)
+
+
+async def find_duplicate(company_id: str, fingerprint: int) -> Optional[Dict]:
+    """
+    Find a recently triaged email of the company that is a near duplicate
+
+    Returns:
+        The stored triage result of the closest match, or None
+    """
+    index = await get_company_index(company_id)
+    return index.find(fingerprint)
+
+
+async def remember(company_id: str, fingerprint: int, result: Dict):
+    """Add a triage result to the company's index"""
+    index = await get_company_index(company_id)
+    index.add(fingerprint, result)
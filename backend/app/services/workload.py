@@ -0,0 +1,118 @@
+"""
+Employee workload counters (users.current_load): how many active issues are
+assigned to each employee. Every write that creates, reassigns, closes or
+deletes an issue applies the resulting changes, and recount_workloads
+rebuilds the counters from the issues themselves:
+
+    python -m app.services.workload [company_id]
+"""
+import argparse
+import asyncio
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+
+from app.database import connect_db, close_db, get_database
+from app.schemas.company import UserRole
+from app.schemas.issues import IssueStatus
+from app.services.employees import adjust_cached_load, invalidate_roster
+
+# Issues that count towards their assignee's load
+ACTIVE_STATUSES = [IssueStatus.OPEN.value, IssueStatus.ASSIGNED.value, IssueStatus.IN_PROGRESS.value]
+
+
+def _load_owner(issue: Optional[Dict]) -> Optional[str]:
+    if issue and issue.get("assigned_to") and issue.get("status", IssueStatus.OPEN.value) in ACTIVE_STATUSES:
+        return issue["assigned_to"]
+    return None
+
+
+def add_load_change(changes: Dict[str, int], before: Optional[Dict], after: Optional[Dict]):
+    """
+    Add the counter changes for an issue going from before to after to
+    changes (user id -> delta). None stands for an issue that does not
+    exist, i.e. one being created or deleted.
+    """
+    old_owner, new_owner = _load_owner(before), _load_owner(after)
+    if old_owner == new_owner:
+        return
+    if old_owner:
+        changes[old_owner] = changes.get(old_owner, 0) - 1
+    if new_owner:
+        changes[new_owner] = changes.get(new_owner, 0) + 1
+
+
+def load_updates(changes: Dict[str, int]) -> List[UpdateOne]:
+    updates = []
+    for user_id, delta in changes.items():
+        if not delta:
+            continue
+        try:
+            updates.append(UpdateOne({"_id": ObjectId(user_id)}, {"$inc": {"current_load": delta}}))
+        except (InvalidId, TypeError):
+            continue
+    return updates
+
+
+async def apply_load_changes(changes: Dict[str, int], session=None):
+    """Apply counter changes in one bulk write and to the cached rosters"""
+    updates = load_updates(changes)
+    if not updates:
+        return
+    db = get_database()
+    await db.users.bulk_write(updates, ordered=False, session=session)
+    for user_id, delta in changes.items():
+        adjust_cached_load(user_id, delta)
+
+
+async def recount_workloads(company_id: Optional[str] = None) -> int:
+    """
+    Rebuild current_load of a company's employees (or everyone's) from
+    their active issues
+
+    Returns:
+        Number of employees updated
+    """
+    db = get_database()
+    issue_filter = {"status": {"$in": ACTIVE_STATUSES}, "assigned_to": {"$nin": [None, ""]}}
+    user_filter = {"role": UserRole.EMPLOYEE.value}
+    if company_id:
+        issue_filter["company_id"] = company_id
+        user_filter["company_id"] = company_id
+
+    counts: Dict[str, int] = defaultdict(int)
+    async for row in db.issues.aggregate([
+        {"$match": issue_filter},
+        {"$group": {"_id": "$assigned_to", "n": {"$sum": 1}}},
+    ]):
+        counts[row["_id"]] = row["n"]
+
+    updates = [
+        UpdateOne({"_id": user["_id"]}, {"$set": {"current_load": counts.get(str(user["_id"]), 0)}})
+        async for user in db.users.find(user_filter, {"_id": 1})
+    ]
+    if updates:
+        await db.users.bulk_write(updates, ordered=False)
+    invalidate_roster(company_id)
+    return len(updates)
+
+
+async def _main(company_id: Optional[str]):
+    await connect_db()
+    try:
+        updated = await recount_workloads(company_id)
+        print(f"Recounted workload of {updated} employees")
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Rebuild employee workload counters from their issues")
+    parser.add_argument("company_id", nargs="?", help="Only this company's employees")
+    args = parser.parse_args()
+    asyncio.run(_main(args.company_id))
@@ -0,0 +1,257 @@
+import hashlib
+from functools import partial
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from app.services.employees import adjust_cached_load
+from app.services.workload import add_load_change, load_updates
+
+# Attempts per bulk call before the documents left are given up on
+WRITE_ATTEMPTS = 3
+DUPLICATE_KEY = 11000
+
+# Collections in the order they are written: updates, assignments and
+# emails may point at issues of the same page
+INSERT_ORDER = ["issues", "assignments", "emails"]
+
+
+def document_id(company_id: str, email_id: str, collection: str) -> ObjectId:
+    """
+    Stable _id for the document a Gmail message produces in collection, so
+    writing a message again (a retried flush, or a later sync triaging a
+    released message) finds the document already there instead of adding
+    a second one
+    """
+    digest = hashlib.sha1(f"{company_id}:{email_id}:{collection}".encode()).digest()
+    return ObjectId(digest[:12])
+
+
+def _adjust_cached_loads(workload: Dict[str, int]):
+    for user_id, delta in workload.items():
+        adjust_cached_load(user_id, delta)
+
+
+class WriteBatch:
+    """
+    Documents a sync page produces, written together in a few bulk calls
+    instead of several round trips per message.
+
+    Every document belongs to the message being processed (see
+    for_message) and gets a stable _id from document_id, and every update
+    is guarded so applying it twice changes nothing. A flush can therefore
+    be retried, or repeated by a later sync, without duplicating anything.
+    Side effects that must only happen once a message's documents exist
+    (queued emails, deferred work) are registered with after_commit.
+    """
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self.owner: Optional[str] = None
+        self._inserts: Dict[str, List[Tuple[Optional[str], Dict]]] = {name: [] for name in INSERT_ORDER}
+        self._issue_updates: List[Tuple[Optional[str], UpdateOne]] = []
+        self._after_commit: List[Tuple[Optional[str], Callable[[], Awaitable]]] = []
+
+    def __len__(self) -> int:
+        return sum(len(docs) for docs in self._inserts.values()) + len(self._issue_updates)
+
+    def for_message(self, message_id: str):
+        """Attribute what is added from now on to this Gmail message"""
+        self.owner = message_id
+
+    def _insert(self, collection: str, doc: Dict):
+        if "_id" not in doc:
+            doc["_id"] = document_id(doc["company_id"], self.owner, collection)
+        self._inserts[collection].append((self.owner, doc))
+
+    def add_issue(self, doc: Dict):
+        self._insert("issues", doc)
+
+    def add_assignment(self, doc: Dict):
+        self._insert("assignments", doc)
+
+    def add_email(self, doc: Dict):
+        self._insert("emails", doc)
+
+    def add_issue_update(self, update: UpdateOne):
+        """update must match nothing once applied, so replaying it is a no-op"""
+        self._issue_updates.append((self.owner, update))
+
+    def discard_message(self, message_id: str):
+        """Drop everything added for a message that failed part way"""
+        for name, docs in self._inserts.items():
+            self._inserts[name] = [entry for entry in docs if entry[0] != message_id]
+        self._issue_updates = [entry for entry in self._issue_updates if entry[0] != message_id]
+        self._after_commit = [entry for entry in self._after_commit if entry[0] != message_id]
+
+    def after_commit(self, fn, *args, **kwargs):
+        self._after_commit.append((self.owner, partial(fn, *args, **kwargs)))
+
+    async def _existing_ids(self, db, session=None) -> Dict[str, Set[ObjectId]]:
+        existing = {}
+        for name, docs in self._inserts.items():
+            ids = [doc["_id"] for _, doc in docs]
+            existing[name] = set()
+            if ids:
+                async for doc in db[name].find({"_id": {"$in": ids}}, {"_id": 1}, session=session):
+                    existing[name].add(doc["_id"])
+        return existing
+
+    async def _insert_all(self, collection, pending: List[Tuple[Optional[str], Dict]]) -> Tuple[List, List]:
+        """
+        Insert pending unordered, retrying what failed; a duplicate key
+        means the document is already there
+
+        Returns:
+            (entries inserted now, entries that could not be written)
+        """
+        inserted = []
+        for _ in range(WRITE_ATTEMPTS):
+            if not pending:
+                break
+            try:
+                await collection.insert_many([doc for _, doc in pending], ordered=False)
+                inserted += pending
+                pending = []
+            except BulkWriteError as e:
+                # pending only holds documents missing before the flush, so
+                # a duplicate is one an earlier attempt wrote after all
+                failed = {
+                    error["index"] for error in e.details.get("writeErrors", [])
+                    if error.get("code") != DUPLICATE_KEY
+                }
+                inserted += [entry for i, entry in enumerate(pending) if i not in failed]
+                pending = [entry for i, entry in enumerate(pending) if i in failed]
+            except PyMongoError as e:
+                # Unknown how much landed; the retry sorts it out through
+                # duplicate keys
+                print(f" Bulk insert into {collection.name} failed, retrying: {e}")
+        return inserted, pending
+
+    async def _update_all(self, db, pending: List[Tuple[Optional[str], UpdateOne]]) -> List:
+        """Apply guarded updates, retrying what failed; returns those that could not be applied"""
+        for _ in range(WRITE_ATTEMPTS):
+            if not pending:
+                break
+            try:
+                await db.issues.bulk_write([op for _, op in pending], ordered=False)
+                pending = []
+            except BulkWriteError as e:
+                failed = {error["index"] for error in e.details.get("writeErrors", [])}
+                pending = [entry for i, entry in enumerate(pending) if i in failed]
+            except PyMongoError as e:
+                print(f" Bulk update of issues failed, retrying: {e}")
+        return pending
+
+    async def _apply_workload(self, db, new_issues: List[Dict], session=None) -> Dict[str, int]:
+        """
+        Update the workload counters for the issues this flush inserted
+
+        Returns:
+            user id -> delta written, for the cached rosters. Without a
+            session they are adjusted here already; in a transaction the
+            caller adjusts them once the commit went through.
+        """
+        workload: Dict[str, int] = {}
+        for issue in new_issues:
+            add_load_change(workload, None, issue)
+        updates = load_updates(workload)
+        if not updates:
+            return {}
+        try:
+            await db.users.bulk_write(updates, ordered=False, session=session)
+        except PyMongoError as e:
+            if session:
+                raise
+            # Counters can be rebuilt with python -m app.services.workload
+            print(f" Failed to update workload counters: {e}")
+            return {}
+        if session is None:
+            _adjust_cached_loads(workload)
+        return workload
+
+    async def _write(self, db) -> Tuple[Set[str], Set[str]]:
+        existing = await self._existing_ids(db)
+        written: Set[str] = set()
+        failed: Set[str] = set()
+        new_issues: List[Dict] = []
+
+        for name in INSERT_ORDER:
+            pending = []
+            for owner, doc in self._inserts[name]:
+                if doc["_id"] in existing[name]:
+                    written.add(owner)
+                else:
+                    pending.append((owner, doc))
+            inserted, left = await self._insert_all(db[name], pending)
+            written.update(owner for owner, _ in inserted)
+            failed.update(owner for owner, _ in left)
+            if name == "issues":
+                new_issues = [doc for _, doc in inserted]
+                await self._apply_workload(db, new_issues)
+                # Follow-ups and duplicate links right after the issues
+                # they point at
+                left_updates = {id(op): owner for owner, op in await self._update_all(db, list(self._issue_updates))}
+                failed.update(left_updates.values())
+                written.update(owner for owner, op in self._issue_updates if id(op) not in left_updates)
+
+        return written, failed
+
+    async def _write_transaction(self, db) -> Set[str]:
+        async with await db.client.start_session() as session:
+            async with session.start_transaction():
+                existing = await self._existing_ids(db, session)
+                new_issues = []
+                for name in INSERT_ORDER:
+                    docs = [doc for _, doc in self._inserts[name] if doc["_id"] not in existing[name]]
+                    if docs:
+                        await db[name].insert_many(docs, ordered=True, session=session)
+                    if name == "issues":
+                        new_issues = docs
+                        if self._issue_updates:
+                            await db.issues.bulk_write([op for _, op in self._issue_updates], ordered=True, session=session)
+                workload = await self._apply_workload(db, new_issues, session)
+        # The transaction committed; an abort or retry raised above and left
+        # the cached rosters alone
+        _adjust_cached_loads(workload)
+        return {owner for owner, _ in self._issue_updates} | {
+            owner for docs in self._inserts.values() for owner, _ in docs
+        }
+
+    async def flush(self, db, transaction: bool = False) -> Tuple[Set[str], Set[str]]:
+        """
+        Write everything gathered so far, then run the after-commit actions
+        of every message whose documents were written.
+
+        Without transaction each bulk call is retried on its own, and a
+        message may end up partly written. With transaction the writes
+        commit or roll back together (needs a replica set), and a failure
+        raises.
+
+        Returns:
+            (ids of messages with at least one document written or already
+            present, ids of messages with a document that could not be
+            written)
+        """
+        written: Set[str] = set()
+        failed: Set[str] = set()
+        if len(self):
+            if transaction:
+                written = await self._write_transaction(db)
+            else:
+                written, failed = await self._write(db)
+
+        for owner, action in self._after_commit:
+            if owner is not None and owner not in written and owner in failed:
+                continue
+            try:
+                await action()
+            except Exception as e:
+                print(f" After-commit action failed: {e}")
+
+        self._reset()
+        return written, failed
@@ -1,13 +1,23 @@
+from dotenv import load_dotenv
+
+# Load environment variables before any app module reads its settings at
+# import time (e.g. GMAIL_MAX_WORKERS, GMAIL_API_ENDPOINT)
+load_dotenv()
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.database import connect_db, close_db
+from app.database import connect_db, close_db, pool_stats
+from app.indexes import ensure_indexes
+from app.services import gmail_client
+from app.services.outbox import start_outbox_sender, stop_outbox_sender
+from app.services.poller import start_poller, stop_poller
+from app.services.deferred import start_deferred_worker, stop_deferred_worker
+from app.services.rollups import start_rollup_worker, stop_rollup_worker
+from app.services.inbox import run_deferred
+from app.services.gmail import load_discovery_document, start_token_refresher, stop_token_refresher
 from app.routers import users
-from dotenv import load_dotenv
 import os
 
-# Load environment variables
-load_dotenv()
-
 app = FastAPI(title="User Management API")
 
 # Configure CORS
@@ -17,14 +27,28 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 @app.on_event("startup")
 async def startup():
     await connect_db()
+    await ensure_indexes()
+    load_discovery_document()
+    start_token_refresher()
+    start_outbox_sender()
+    start_deferred_worker(run_deferred)
+    start_rollup_worker()
+    start_poller()
 
 @app.on_event("shutdown")
 async def shutdown():
+    await stop_poller()
+    await stop_deferred_worker()
+    await stop_rollup_worker()
+    await stop_outbox_sender()
+    await stop_token_refresher()
+    gmail_client.shutdown()
     await close_db()
 
 app.include_router(users.router, prefix="/users", tags=["Users"])
@@ -47,4 +71,9 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
+
+@app.get("/health/db-pool")
+async def db_pool_stats():
+    """MongoDB connection pool counters per client and server"""
+    return pool_stats()
\ No newline at end of file
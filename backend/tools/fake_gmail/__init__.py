@@ -0,0 +1,14 @@
+"""
+Local stand-in for the Gmail API, for exercising the ingestion path offline.
+
+Run it with:
+
+    python -m tools.fake_gmail --messages 5000 --port 8025
+
+then start the backend with GMAIL_API_ENDPOINT=http://localhost:8025/ so
+every Gmail service is built against it.
+"""
+from tools.fake_gmail.mailbox import generate_mailbox
+from tools.fake_gmail.server import create_app
+
+__all__ = ["create_app", "generate_mailbox"]
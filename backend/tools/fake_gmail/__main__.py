@@ -0,0 +1,38 @@
+import argparse
+
+import uvicorn
+
+from tools.fake_gmail.mailbox import generate_mailbox
+from tools.fake_gmail.server import create_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake Gmail API over a synthetic mailbox")
+    parser.add_argument("--messages", type=int, default=1000, help="Number of messages in the mailbox")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--thread-ratio", type=float, default=0.2, help="Share of messages that are follow-ups")
+    parser.add_argument("--max-thread-depth", type=int, default=4)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.1, help="Share of near-duplicate complaints")
+    parser.add_argument("--unread-ratio", type=float, default=1.0)
+    parser.add_argument("--latency-ms", type=float, default=0, help="Delay added to every call")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0, help="Share of calls answered with 429")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8025)
+    args = parser.parse_args()
+
+    messages = generate_mailbox(
+        size=args.messages,
+        seed=args.seed,
+        thread_ratio=args.thread_ratio,
+        max_thread_depth=args.max_thread_depth,
+        duplicate_ratio=args.duplicate_ratio,
+        unread_ratio=args.unread_ratio,
+    )
+    print(f"📬 Generated {len(messages)} messages")
+
+    app = create_app(messages, latency_ms=args.latency_ms, rate_limit_ratio=args.rate_limit_ratio, seed=args.seed)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+import base64
+import random
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from email.utils import format_datetime, make_msgid
+from typing import Dict, List, Optional
+
+SENDERS = [
+    ("Aarav Sharma", "aarav.sharma@example.com"),
+    ("Priya Thapa", "priya.thapa@example.com"),
+    ("Sita Karki", "sita.karki@example.org"),
+    ("Rohan Gurung", "rohan.gurung@example.net"),
+    ("Maya Shrestha", "maya.shrestha@example.com"),
+    ("Deals Daily", "offers@promo.example.biz"),
+]
+
+TEMPLATES = {
+    "inquiry": [
+        ("Question about pricing", "Hi,\n\nCould you send me the pricing for {product}? I'd also like to know if you offer discounts for orders above {qty} units.\n\nThanks,\n{name}"),
+        ("Product availability", "Hello,\n\nIs {product} in stock right now? We are planning an order of {qty} units next week.\n\nRegards,\n{name}"),
+    ],
+    "issue": [
+        ("Order not delivered", "Hi team,\n\nMy order #{order} for {product} was supposed to arrive {days} days ago and still hasn't. Please look into it.\n\n{name}"),
+        ("Payment failed but money deducted", "Hello,\n\nI tried to pay for order #{order} and the payment failed, but Rs. {amount} was deducted from my account. Please refund or confirm the order.\n\nThanks,\n{name}"),
+        ("Damaged item received", "Hi,\n\nThe {product} from order #{order} arrived damaged. The box was crushed and the item does not work. I want a replacement.\n\n{name}"),
+        ("Cannot log in to my account", "Hello support,\n\nI've been unable to log in since yesterday. The reset password link gives an error page.\n\nBest,\n{name}"),
+    ],
+    "spam": [
+        ("Limited time offer!!!", "Get 90% off on all SEO packages. Grow your business with our promotional services. Click here to claim your offer before it expires."),
+    ],
+}
+
+PRODUCTS = ["wireless mouse", "office chair", "LED monitor", "laptop stand", "USB-C hub", "printer ink"]
+
+SIGNATURE = "\n\n-- \n{name}\nSent from my phone"
+QUOTE = "\n\nOn {date}, Support <support@company.example> wrote:\n> Thanks for reaching out.\n> We are looking into it."
+FOOTER = "\n\nTo unsubscribe from these emails, click here."
+
+# MIME layouts a generated message may take, with their relative weight
+MIME_SHAPES = {
+    "plain": 4,
+    "html": 1,
+    "alternative": 3,
+    "attachment": 1,
+    "nested": 1,
+}
+
+
+def _b64url(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def _html(text: str) -> str:
+    paragraphs = "".join(f"<p>{p.replace(chr(10), '<br>')}</p>" for p in text.split("\n\n"))
+    return f"<html><head><style>p {{ margin: 0 }}</style></head><body>{paragraphs}</body></html>"
+
+
+def _build_mime(shape: str, text: str, rng: random.Random) -> EmailMessage:
+    message = EmailMessage()
+    if shape == "plain":
+        message.set_content(text)
+    elif shape == "html":
+        message.set_content(_html(text), subtype="html")
+    elif shape == "alternative":
+        message.set_content(text)
+        message.add_alternative(_html(text), subtype="html")
+    elif shape == "attachment":
+        message.set_content(text)
+        message.add_attachment(
+            rng.randbytes(rng.randint(2_000, 20_000)),
+            maintype="application",
+            subtype="pdf",
+            filename="invoice.pdf"
+        )
+    else:
+        # multipart/mixed wrapping multipart/alternative, plus an inline image
+        message.set_content(text)
+        message.add_alternative(_html(text), subtype="html")
+        message.make_mixed()
+        message.add_attachment(rng.randbytes(1_000), maintype="image", subtype="png", filename="photo.png")
+    return message
+
+
+def to_gmail_payload(part: EmailMessage, part_id: str = "") -> Dict:
+    """Convert a MIME part into the payload shape of messages.get(format=full)"""
+    payload = {
+        "partId": part_id,
+        "mimeType": part.get_content_type(),
+        "filename": part.get_filename() or "",
+        "headers": [{"name": k, "value": str(v)} for k, v in part.items()],
+    }
+    if part.is_multipart():
+        payload["body"] = {"size": 0}
+        payload["parts"] = [
+            to_gmail_payload(child, f"{part_id}.{i}" if part_id else str(i))
+            for i, child in enumerate(part.iter_parts())
+        ]
+    else:
+        data = part.get_payload(decode=True) or b""
+        payload["body"] = {"size": len(data), "data": _b64url(data)}
+    return payload
+
+
+def generate_mailbox(
+    size: int = 1000,
+    seed: int = 0,
+    thread_ratio: float = 0.2,
+    max_thread_depth: int = 4,
+    duplicate_ratio: float = 0.1,
+    unread_ratio: float = 1.0,
+    mime_shapes: Optional[Dict[str, int]] = None,
+) -> List[Dict]:
+    """
+    Build a synthetic mailbox of Gmail message resources, oldest first.
+
+    Args:
+        size: Number of messages
+        seed: Random seed, so the same arguments give the same mailbox
+        thread_ratio: Share of messages that are follow-ups in an earlier thread
+        max_thread_depth: Most messages a single thread may hold
+        duplicate_ratio: Share of messages that repeat an earlier complaint
+            with small wording changes
+        unread_ratio: Share of messages labelled UNREAD
+        mime_shapes: Weights of the MIME layouts (see MIME_SHAPES)
+
+    Returns:
+        Message dicts with id, threadId, labelIds, snippet, internalDate,
+        sizeEstimate, payload and raw, as Gmail would return them
+    """
+    rng = random.Random(seed)
+    shapes = mime_shapes or MIME_SHAPES
+    shape_names, shape_weights = list(shapes), list(shapes.values())
+    start = datetime(2025, 1, 1, 8, 0, 0)
+
+    messages: List[Dict] = []
+    threads: Dict[str, List[Dict]] = {}
+    originals: List[Dict] = []
+
+    for n in range(size):
+        sent_at = start + timedelta(minutes=7 * n + rng.randint(0, 6))
+        open_threads = [t for t, msgs in threads.items() if len(msgs) < max_thread_depth]
+
+        if open_threads and rng.random() < thread_ratio:
+            thread_id = rng.choice(open_threads)
+            first = threads[thread_id][0]
+            name, address = first["sender"]
+            subject = f"Re: {first['subject']}"
+            text = rng.choice([
+                "Any update on this? It has been a few days.",
+                "Following up again, please reply.",
+                "I still haven't heard back about this.",
+            ]) + QUOTE.format(date=first["sent_at"].strftime("%a, %b %d, %Y at %I:%M %p"))
+            in_reply_to = first["message_id"]
+        elif originals and rng.random() < duplicate_ratio:
+            original = rng.choice(originals)
+            thread_id = f"t{n:08x}"
+            name, address = rng.choice(SENDERS)
+            subject = original["subject"]
+            text = original["text"].replace(original["sender"][0], name).replace("Hi", rng.choice(["Hi", "Hello", "Hey"]), 1)
+            in_reply_to = None
+        else:
+            thread_id = f"t{n:08x}"
+            name, address = rng.choice(SENDERS)
+            kind = "spam" if address.endswith(".biz") else rng.choice(["inquiry", "issue", "issue"])
+            subject, body = rng.choice(TEMPLATES[kind])
+            text = body.format(
+                name=name,
+                product=rng.choice(PRODUCTS),
+                qty=rng.choice([10, 25, 50, 100]),
+                order=rng.randint(10000, 99999),
+                days=rng.randint(2, 10),
+                amount=rng.choice([499, 1250, 3200, 7800]),
+            )
+            if kind == "spam":
+                text += FOOTER
+            elif rng.random() < 0.5:
+                text += SIGNATURE.format(name=name)
+            in_reply_to = None
+
+        mime = _build_mime(rng.choices(shape_names, shape_weights)[0], text, rng)
+        mime["From"] = f"{name} <{address}>"
+        mime["To"] = "support@company.example"
+        mime["Subject"] = subject
+        mime["Date"] = format_datetime(sent_at)
+        mime["Message-ID"] = make_msgid(idstring=str(n), domain="mail.example.com")
+        if in_reply_to:
+            mime["In-Reply-To"] = in_reply_to
+            mime["References"] = in_reply_to
+
+        raw = mime.as_bytes()
+        labels = ["INBOX"]
+        if rng.random() < unread_ratio:
+            labels.append("UNREAD")
+
+        message = {
+            "id": f"{n:016x}",
+            "threadId": thread_id,
+            "labelIds": labels,
+            "snippet": " ".join(text.split())[:100],
+            "internalDate": str(int(sent_at.timestamp() * 1000)),
+            "sizeEstimate": len(raw),
+            "payload": to_gmail_payload(mime),
+            "raw": _b64url(raw),
+        }
+        messages.append(message)
+
+        record = {"sender": (name, address), "subject": subject, "text": text,
+                  "sent_at": sent_at, "message_id": mime["Message-ID"]}
+        threads.setdefault(thread_id, []).append(record)
+        if not in_reply_to:
+            originals.append(record)
+
+    return messages
@@ -0,0 +1,254 @@
+import asyncio
+import base64
+import json
+import random
+import re
+import uuid
+from email import message_from_bytes
+from email.message import EmailMessage
+from email.parser import BytesParser
+from email.policy import HTTP
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse
+
+from tools.fake_gmail.mailbox import to_gmail_payload
+
+_MESSAGE_PATH_RE = re.compile(r"/users/[^/]+/messages/(?!batchModify$|send$)[^/]+$")
+
+SYSTEM_LABELS = ["INBOX", "UNREAD", "SENT", "DRAFT", "SPAM", "TRASH", "IMPORTANT", "STARRED"]
+
+
+class FakeMailbox:
+    """
+    In-memory mailbox shared by every userId, holding messages, labels,
+    drafts and sent mail
+    """
+
+    def __init__(self, messages: List[Dict]):
+        # Gmail lists newest first
+        self.messages = {m["id"]: m for m in sorted(messages, key=lambda m: int(m["internalDate"]), reverse=True)}
+        self.labels = {name: {"id": name, "name": name, "type": "system"} for name in SYSTEM_LABELS}
+        self.drafts: Dict[str, Dict] = {}
+        self.sent: List[Dict] = []
+        self.stats: Dict[str, int] = {}
+
+    def label_id(self, name: str) -> Optional[str]:
+        for label in self.labels.values():
+            if label["name"].lower() == name.lower() or label["id"] == name:
+                return label["id"]
+        return None
+
+    def matches(self, message: Dict, label_ids: List[str], query: Optional[str]) -> bool:
+        labels = set(message["labelIds"])
+        if not set(label_ids) <= labels:
+            return False
+        # Only label:/-label: terms are understood; other search terms are ignored
+        for term in (query or "").split():
+            negate = term.startswith("-")
+            key, _, value = term.lstrip("-").partition(":")
+            if key != "label":
+                continue
+            has_label = self.label_id(value) in labels
+            if has_label == negate:
+                return False
+        return True
+
+    def store(self, raw: str, label_ids: List[str], thread_id: Optional[str] = None) -> Dict:
+        data = base64.urlsafe_b64decode(raw + "=" * (-len(raw) % 4))
+        mime = message_from_bytes(data, _class=EmailMessage)
+        message_id = uuid.uuid4().hex[:16]
+        return {
+            "id": message_id,
+            "threadId": thread_id or message_id,
+            "labelIds": label_ids,
+            "snippet": "",
+            "sizeEstimate": len(data),
+            "payload": to_gmail_payload(mime),
+            "raw": raw,
+        }
+
+
+def _error(status: int, reason: str, message: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=status,
+        content={"error": {"code": status, "message": message, "errors": [{"reason": reason, "message": message}]}}
+    )
+
+
+def create_app(messages: List[Dict], latency_ms: float = 0, rate_limit_ratio: float = 0, seed: int = 0) -> FastAPI:
+    """
+    Build a fake Gmail API over a synthetic mailbox.
+
+    Args:
+        messages: Message resources, e.g. from generate_mailbox()
+        latency_ms: Delay added to every call
+        rate_limit_ratio: Share of calls answered with 429 rateLimitExceeded
+        seed: Random seed for the injected rate limits
+    """
+    app = FastAPI(title="Fake Gmail API")
+    mailbox = FakeMailbox(messages)
+    rng = random.Random(seed)
+    app.state.mailbox = mailbox
+
+    @app.middleware("http")
+    async def simulate_network(request: Request, call_next):
+        key = f"{request.method} {_MESSAGE_PATH_RE.sub('/users/{userId}/messages/{id}', request.url.path)}"
+        mailbox.stats[key] = mailbox.stats.get(key, 0) + 1
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        if rate_limit_ratio and request.url.path != "/batch" and rng.random() < rate_limit_ratio:
+            response = _error(429, "rateLimitExceeded", "Rate Limit Exceeded")
+            response.headers["Retry-After"] = "1"
+            return response
+        return await call_next(request)
+
+    @app.get("/gmail/v1/users/{user_id}/labels")
+    async def list_labels(user_id: str):
+        return {"labels": list(mailbox.labels.values())}
+
+    @app.post("/gmail/v1/users/{user_id}/labels")
+    async def create_label(user_id: str, body: Dict):
+        if mailbox.label_id(body["name"]):
+            return _error(409, "duplicate", "Label name exists or conflicts")
+        label = {**body, "id": f"Label_{len(mailbox.labels)}", "type": "user"}
+        mailbox.labels[label["id"]] = label
+        return label
+
+    @app.get("/gmail/v1/users/{user_id}/messages")
+    async def list_messages(
+        user_id: str,
+        labelIds: List[str] = Query([]),
+        q: Optional[str] = None,
+        maxResults: int = Query(100, ge=1, le=500),
+        pageToken: Optional[str] = None,
+    ):
+        matching = [m for m in mailbox.messages.values() if mailbox.matches(m, labelIds, q)]
+        start = int(pageToken or 0)
+        page = matching[start:start + maxResults]
+        result = {
+            "messages": [{"id": m["id"], "threadId": m["threadId"]} for m in page],
+            "resultSizeEstimate": len(matching),
+        }
+        if start + maxResults < len(matching):
+            result["nextPageToken"] = str(start + maxResults)
+        if not page:
+            del result["messages"]
+        return result
+
+    @app.get("/gmail/v1/users/{user_id}/messages/{message_id}")
+    async def get_message(user_id: str, message_id: str, format: str = "full"):
+        message = mailbox.messages.get(message_id)
+        if message is None:
+            raise HTTPException(status_code=404, detail="Requested entity was not found.")
+
+        fields = ["id", "threadId", "labelIds", "snippet", "internalDate", "sizeEstimate"]
+        result = {k: message[k] for k in fields if k in message}
+        if format == "raw":
+            result["raw"] = message["raw"]
+        elif format == "metadata":
+            result["payload"] = {k: v for k, v in message["payload"].items() if k in ("mimeType", "headers")}
+        elif format == "full":
+            result["payload"] = message["payload"]
+        return result
+
+    @app.post("/gmail/v1/users/{user_id}/messages/batchModify", status_code=204)
+    async def batch_modify(user_id: str, body: Dict):
+        if len(body.get("ids", [])) > 1000:
+            return _error(400, "invalidArgument", "Too many ids, at most 1000 are allowed")
+        add = body.get("addLabelIds", [])
+        remove = set(body.get("removeLabelIds", []))
+        for message_id in body.get("ids", []):
+            message = mailbox.messages.get(message_id)
+            if message:
+                labels = [label for label in message["labelIds"] if label not in remove]
+                message["labelIds"] = labels + [label for label in add if label not in labels]
+        return Response(status_code=204)
+
+    @app.post("/gmail/v1/users/{user_id}/messages/send")
+    async def send_message(user_id: str, body: Dict):
+        message = mailbox.store(body["raw"], ["SENT"], body.get("threadId"))
+        mailbox.sent.append(message)
+        return {"id": message["id"], "threadId": message["threadId"], "labelIds": message["labelIds"]}
+
+    @app.post("/gmail/v1/users/{user_id}/drafts")
+    async def create_draft(user_id: str, body: Dict):
+        message = mailbox.store(body["message"]["raw"], ["DRAFT"], body["message"].get("threadId"))
+        draft = {"id": f"r{uuid.uuid4().int % 10 ** 19}", "message": {"id": message["id"], "threadId": message["threadId"], "labelIds": ["DRAFT"]}}
+        mailbox.drafts[draft["id"]] = {**draft, "message": message}
+        return draft
+
+    @app.get("/stats")
+    async def stats():
+        """Call counts per endpoint, plus what was sent and drafted"""
+        return {"calls": mailbox.stats, "sent": len(mailbox.sent), "drafts": len(mailbox.drafts)}
+
+    @app.post("/batch")
+    async def batch(request: Request):
+        """
+        Answer a multipart/mixed batch by replaying each part against this app
+        """
+        content_type = request.headers["content-type"]
+        envelope = f"Content-Type: {content_type}\r\n\r\n".encode() + await request.body()
+        container = BytesParser(policy=HTTP).parsebytes(envelope)
+
+        boundary = f"batch_{uuid.uuid4().hex}"
+        chunks = []
+        for part in container.iter_parts():
+            http_request = part.get_payload(decode=True) or part.get_payload().encode()
+            head, _, body = http_request.partition(b"\r\n\r\n")
+            if not body and b"\n\n" in http_request:
+                head, _, body = http_request.partition(b"\n\n")
+            request_line, *header_lines = head.decode().splitlines()
+            method, url, _ = request_line.split(" ", 2)
+            headers = dict(line.split(": ", 1) for line in header_lines if ": " in line)
+
+            status, payload = await _dispatch(app, method, url, headers, body)
+            content_id = part.get("Content-ID", "").strip("<>")
+            chunks.append(
+                f"--{boundary}\r\n"
+                f"Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}\r\n"
+                f"Content-Type: application/json; charset=UTF-8\r\n\r\n"
+                f"{payload}\r\n"
+            )
+        chunks.append(f"--{boundary}--\r\n")
+        return Response("".join(chunks), media_type=f"multipart/mixed; boundary={boundary}")
+
+    return app
+
+
+async def _dispatch(app: FastAPI, method: str, url: str, headers: Dict[str, str], body: bytes):
+    """Run one batched request through the app's own routes"""
+    parts = urlsplit(url)
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": parts.path,
+        "raw_path": parts.path.encode(),
+        "query_string": parts.query.encode(),
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+        "client": ("127.0.0.1", 0),
+        "server": ("127.0.0.1", 0),
+    }
+    response = {"status": 500, "body": b""}
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(event):
+        if event["type"] == "http.response.start":
+            response["status"] = event["status"]
+        elif event["type"] == "http.response.body":
+            response["body"] += event.get("body", b"")
+
+    await app(scope, receive, send)
+    return response["status"], response["body"].decode() or json.dumps({})
+
@@ -43,6 +43,7 @@ export const authOptions: any = {
             {
               access_token: account.access_token,
               refresh_token: account.refresh_token,
+              expires_at: account.expires_at,
               user: {
                 id: user?.id || "",
                 name: user?.name || "",